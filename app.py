@@ -1,24 +1,23 @@
 import streamlit as st
 import google.generativeai as genai
-from tinydb import TinyDB, Query
-import json          
-import base64
-import io
-from PIL import Image
-import tempfile
 import os
 import html # <--- ADD THIS LINE
 from datetime import datetime
-import re
 import uuid             
 import time
-from gtts import gTTS
-import pandas as pd
-import docx
-import PyPDF2
-import markdown
-from io import BytesIO
-import zipfile
+import contextlib
+import functools
+import concurrent.futures
+import extractors
+import storage
+import tts
+import response_cache
+import chat_engine
+import context_builder
+import metrics
+import blob_store
+import exports
+import extraction_cache
 
 # Page configuration
 st.set_page_config(
@@ -33,10 +32,24 @@ if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'chat_id' not in st.session_state:
     st.session_state.chat_id = str(uuid.uuid4())
-if 'db' not in st.session_state:
-    st.session_state.db = TinyDB('chat_history.json')
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = []
+if 'retrieval_keys' not in st.session_state:
+    # Retrieval index keys of the uploaded text files, when whole-document search is on
+    st.session_state.retrieval_keys = []
+if 'full_text_keys' not in st.session_state:
+    # Extraction cache keys of the whole documents behind truncated excerpts (None where the
+    # excerpt is the whole file), for the server-side context cache
+    st.session_state.full_text_keys = []
+if 'history_window' not in st.session_state:
+    # How many of the most recent messages the chat view renders
+    st.session_state.history_window = 0
+if 'saved_message_counts' not in st.session_state:
+    # chat_id -> number of messages already persisted (high-water mark for incremental saves)
+    st.session_state.saved_message_counts = {}
+if 'history_cursors' not in st.session_state:
+    # (timestamp, chat_id) page boundaries the history browser has paged past
+    st.session_state.history_cursors = []
 
 # Custom CSS - Modern Dark Theme
 st.markdown("""
@@ -285,151 +298,336 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class GeminiChat:
-    def __init__(self):
-        self.api_key = st.secrets.get("GEMINI_API_KEY", "")
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
+INGESTION_WORKERS = min(4, os.cpu_count() or 1)
+FILE_PROCESSING_TIMEOUT = 60  # seconds a single file may spend in a worker
+DOWNLOAD_CACHE_SIZE = 256  # responses whose download artifacts are kept in memory
+HISTORY_PAGE_SIZE = 10  # saved chats listed per page in the history browser
+HISTORY_SEARCH_RESULTS = 20
+REQUEST_MODE_LABELS = {
+    "auto": "Auto",
+    "text": "Text chat",
+    "image": "Image generation",
+    "file_analysis": "File analysis",
+}
+BULK_EXPORT_PROGRESS_EVERY = 50  # chats between progress bar updates
+EXPORT_FORMAT_LABELS = {"jsonl": "JSON Lines", "md": "Markdown", "txt": "Plain text"}
+BLOB_STORE_MAX_BYTES = 512 * 1024 * 1024  # audio and images referenced by messages and uploads
+
+@st.cache_resource
+def get_chat_storage():
+    """One storage engine per process, shared by all sessions (it does its own locking)"""
+    # "sqlite" (default) or "tinydb" for the original chat_history.json store
+    return storage.open_storage(st.secrets.get("CHAT_STORAGE", "sqlite"))
+
+@st.cache_resource
+def get_metrics():
+    """Process-wide stage timings, shown in the Diagnostics panel"""
+    return metrics.MetricsRegistry()
+
+@st.cache_resource
+def get_extraction_cache():
+    """Process-wide extraction cache shared by all sessions"""
+    return extraction_cache.ExtractionCache()
+
+@st.cache_resource
+def get_blob_store():
+    """Process-wide store for message audio/images; sessions only hold references into it"""
+    return blob_store.BlobStore(max_bytes=BLOB_STORE_MAX_BYTES)
+
+def store_blob(content):
+    """Swap an uploaded image's bytes for a blob reference; text passes through"""
+    if isinstance(content, dict) and "data" in content:
+        return get_blob_store().put(content["data"], content["mime_type"])
+    return content
+
+def resolve_files(files):
+    """Uploaded contents as the model expects them, loading referenced images (evicted ones are dropped)"""
+    resolved = [get_blob_store().resolve_image(content) for content in files]
+    return [content for content in resolved if content is not None] or None
+
+def resolve_full_texts(files, full_text_keys):
+    """The uploads with each truncated excerpt swapped for its whole document, for the context cache.
+
+    None if a document has left the extraction cache; the turn then sends the excerpts as usual."""
+    cache = get_extraction_cache()
+    full_files = []
+    for content, key in zip(files, full_text_keys):
+        if key is not None:
+            content = cache.get(key)
+            if content is None:
+                return None
+        full_files.append(content)
+    return resolve_files(full_files)
+
+@st.cache_resource
+def get_ingestion_pool():
+    """Process pool shared by all sessions for CPU-bound file parsing"""
+    import multiprocessing
+
+    # spawn, not fork: forking the multi-threaded Streamlit server is unsafe
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=INGESTION_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+def recycle_ingestion_pool(pool):
+    """Kill pool's workers and have the next get_ingestion_pool() start a fresh pool.
+
+    Cancelling a running future doesn't stop it, so a parser stuck on one file
+    would hold its worker forever and every later upload would queue behind
+    it. Work still running in pool fails with BrokenExecutor."""
+    if get_ingestion_pool() is pool:
+        get_ingestion_pool.clear()
+    # No public way to reach the workers before Python 3.14's terminate_workers()
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        with contextlib.suppress(Exception):
+            process.terminate()
+
+@st.cache_resource
+def get_retrieval_store():
+    """Process-wide document retrieval indexes, persisted per file hash"""
+    # NumPy is only loaded once someone turns retrieval on
+    import retrieval
+    return retrieval.RetrievalStore()
+
+@st.cache_resource
+def get_request_engine():
+    """Process-wide request engine: rate limiting, retries and coalescing shared by all sessions"""
+    # asyncio is a noticeable share of cold start; defer it to the first model call
+    import request_engine
+
+    return request_engine.RequestEngine(
+        requests_per_minute=int(st.secrets.get("GEMINI_RPM", 30)),
+        max_concurrency=int(st.secrets.get("GEMINI_MAX_CONCURRENCY", 8)),
+    )
+
+@st.cache_resource
+def get_response_cache():
+    """Process-wide cache of model responses for identical requests"""
+    return response_cache.ResponseCache()
+
+@st.cache_resource
+def get_context_cache():
+    """Process-wide registry of uploads cached server-side, shared by sessions with the same files"""
+    import context_cache
+
+    return context_cache.ContextCache(
+        ttl_seconds=int(st.secrets.get("CONTEXT_CACHE_TTL", context_cache.DEFAULT_TTL_SECONDS)),
+    )
+
+class GeminiChat(chat_engine.ChatEngine):
+    """ChatEngine wired to the app: secrets, process-wide resources, uploads and chat storage"""
+
+    def __init__(self, api_key):
+        text_model = image_model = None
+        if api_key:
+            genai.configure(api_key=api_key)
             # Use current, publicly available and capable models
             # gemini-1.5-flash is a fast, multimodal model for chat and analysis
-            self.text_model = genai.GenerativeModel('gemini-2.0-flash-lite')
+            text_model = genai.GenerativeModel('gemini-2.0-flash-lite')
             try:
                 # Gemini 1.5 Pro is powerful and can generate images
-                self.image_model = genai.GenerativeModel('gemini-2.0-flash-lite')
+                image_model = genai.GenerativeModel('gemini-2.0-flash-lite')
             except Exception as e:
                 st.warning(f"Could not initialize the image generation model: {e}")
-                self.image_model = None
-        
-    def is_image_generation_request(self, prompt):
-        """Check if prompt is for image generation"""
-        image_keywords = ['create image', 'generate image', 'draw', 'imagine', 'visualize', 
-                         'make a picture', 'design', 'create a graphic', 'illustrate']
-        return any(keyword in prompt.lower() for keyword in image_keywords)
-    
-    def process_uploaded_file(self, uploaded_file):
-        """Process different file types. Returns content as string or PIL Image."""
-        try:
-            file_extension = uploaded_file.name.split('.')[-1].lower()
-            
-            if file_extension in ['jpg', 'jpeg', 'png', 'gif', 'webp']:
-                # For images, return a PIL Image object for the model to analyze
-                image = Image.open(uploaded_file)
-                return image
-            
-            content = ""
-            if file_extension == 'pdf':
-                pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                for page in pdf_reader.pages:
-                    content += page.extract_text()
-            elif file_extension in ['txt', 'md']:
-                content = str(uploaded_file.read(), "utf-8")
-            elif file_extension == 'docx':
-                doc = docx.Document(uploaded_file)
-                content = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
-            elif file_extension in ['csv']:
-                df = pd.read_csv(uploaded_file)
-                content = df.head(100).to_string()
-            elif file_extension == 'json':
-                data = json.load(uploaded_file)
-                content = json.dumps(data, indent=2)[:5000]
-            
-            return content[:10000]
-        except Exception as e:
-            # Return the error as a string so it can be displayed to the user
-            return f"Error processing file {uploaded_file.name}: {str(e)}"
+                image_model = None
+        super().__init__(text_model, image_model, api_key=api_key, metrics=get_metrics())
 
-    def generate_response(self, prompt, files=None, context=None):
-        """Generate response using Gemini API for image generation OR for analyzing text, files, and uploaded images."""
-        try:
-            # First, check if the user wants to CREATE an image.
-            # This flow is separate from analyzing uploaded files.
-            if self.is_image_generation_request(prompt) and self.image_model:
-                try:
-                    # --- START: UPDATED IMAGE GENERATION LOGIC ---
-                    full_prompt = re.sub(r'\[.*?\]\s*', '', prompt).strip()
-
-                    # Handle negative prompts included in the chat input.
-                    # e.g., "A beautiful landscape --no buildings, cars"
-                    prompt_parts = full_prompt.split('--no', 1)
-                    positive_prompt = prompt_parts[0].strip()
-                    
-                    # Create the contents list, which is a more robust method.
-                    generation_contents = [positive_prompt]
-                    
-                    if len(prompt_parts) > 1 and prompt_parts[1].strip():
-                        negative_prompt = prompt_parts[1].strip()
-                        # Add the negative prompt in the format the API expects.
-                        generation_contents.append(f"Negative prompt: {negative_prompt}")
-
-                    # Generate content using the list of prompts.
-                    response = self.image_model.generate_content(generation_contents)
-                    
-                    # Check if the response contains an image part, as before.
-                    if hasattr(response, 'parts') and any(p.mime_type.startswith("image/") for p in response.parts):
-                        return response, "image"
-                    else:
-                        # Fallback if no image is generated, return the text response.
-                        return response, "text"
-                    # --- END: UPDATED IMAGE GENERATION LOGIC ---
+    # Engine, cache and retrieval indexes are process-wide and created on first use
+    def get_request_engine(self):
+        return get_request_engine()
 
+    def get_response_cache(self):
+        return get_response_cache()
+
+    def get_context_cache(self):
+        return get_context_cache()
+
+    def get_retrieval_store(self):
+        return get_retrieval_store()
+
+    def report_error(self, message):
+        st.error(message)
+    
+    def process_uploaded_files(self, uploaded_files, timeout=FILE_PROCESSING_TIMEOUT, page_range=None, full_text=False):
+        """Extract several uploads in parallel.
+
+        Yields (index, content, error) as each file finishes, so the sidebar can
+        report progress; index is the file's position in uploaded_files. Cache
+        hits come back immediately, misses are fanned out to the ingestion
+        process pool with a per-file timeout; a file that runs past it has its
+        worker killed (see recycle_ingestion_pool). page_range limits which PDF
+        pages are read; full_text extracts whole documents, for retrieval or
+        the server-side context cache."""
+        cache = get_extraction_cache()
+        options = extraction_cache.extraction_options(page_range, full_text)
+        max_chars = None if full_text else extractors.MAX_CONTENT_CHARS
+        misses = []
+        for index, uploaded_file in enumerate(uploaded_files):
+            try:
+                file_extension = uploaded_file.name.split('.')[-1].lower()
+                file_bytes = uploaded_file.getvalue()
+                cache_key = cache.make_key(file_bytes, file_extension, options)
+                with self.metrics.timer("file_cache_lookup") as sample:
+                    sample["bytes"] = len(file_bytes)
+                    cached_content = cache.get(cache_key, source_size=len(file_bytes))
+            except Exception as e:
+                yield index, None, str(e)
+                continue
+            if cached_content is not None:
+                yield index, cached_content, None
+            else:
+                misses.append((index, file_extension, file_bytes, cache_key))
+
+        # Every miss goes to the pool, even a single file: only a worker process can be
+        # killed when a parser hangs past the timeout
+        pool = get_ingestion_pool()
+        pending = {}
+
+        def submit(index, file_extension, file_bytes, cache_key, submitted):
+            try:
+                future = pool.submit(extractors.extract_content, file_bytes, file_extension, page_range, max_chars)
+            except Exception as e:
+                return str(e)
+            # Start time is filled in once the worker actually picks the file up;
+            # the metrics time the whole wait, queueing included
+            pending[future] = [index, file_extension, file_bytes, cache_key, None, submitted]
+            return None
+
+        for index, file_extension, file_bytes, cache_key in misses:
+            error = submit(index, file_extension, file_bytes, cache_key, time.perf_counter())
+            if error:
+                yield index, None, error
+
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, timeout=0.25, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                index, _, file_bytes, cache_key, _, submitted = pending.pop(future)
+                error = future.exception() is not None
+                self.metrics.observe("file_processing", time.perf_counter() - submitted, size=len(file_bytes), error=error)
+                try:
+                    content = chat_engine.load_extracted_content(future.result())
+                    cache.put(cache_key, content)
+                    yield index, content, None
+                except concurrent.futures.BrokenExecutor as e:
+                    # A crashed worker poisons the pool; replace it so the next batch gets a fresh one
+                    recycle_ingestion_pool(pool)
+                    yield index, None, f"worker crashed: {e}"
                 except Exception as e:
-                    st.error(f"Image generation failed: {e}")
-                    fallback_prompt = f"I tried to generate an image for '{prompt}', but an error occurred. Here is a text description instead: {prompt}"
-                    fallback_response = self.text_model.generate_content(fallback_prompt)
-                    return fallback_response, "text"
-
-            # This is the flow for analyzing inputs (text, uploaded files, and uploaded images).
-            model_input = []
-
-            if context:
-                context_text = "\n".join([f"{msg['role']}: {msg['content'][:500]}" for msg in context[-5:]])
-                model_input.append(f"Context from conversation:\n{context_text}\n---")
-
-            # Add uploaded files (text or images) to the model input
-            if files:
-                model_input.append("Please analyze the following uploaded file(s) to answer the user's request:")
-                for file_content in files:
-                    if isinstance(file_content, str):
-                        model_input.append(f"--- File Content ---\n{file_content[:4000]}")
-                    elif isinstance(file_content, Image.Image):
-                        # Add the PIL image object directly to the input
-                        model_input.append(file_content)
-            
-            # Add the user's prompt to the end of the input list
-            model_input.append(f"\n--- User's Request ---\n{prompt}")
-            
-            # Generate a response from the combined multimodal input
-            response = self.text_model.generate_content(model_input)
-            return response, "text"
-            
-        except Exception as e:
-            return f"Error: {str(e)}", "error"
+                    yield index, None, str(e)
+
+            now = time.monotonic()
+            timed_out = []
+            for future, entry in list(pending.items()):
+                if entry[4] is None:
+                    if future.running():
+                        entry[4] = now
+                elif now - entry[4] > timeout:
+                    del pending[future]
+                    timed_out.append(entry)
+            if not timed_out:
+                continue
+            # The stuck worker only stops with its pool; the rest of this batch starts over on a new one
+            recycle_ingestion_pool(pool)
+            pool = get_ingestion_pool()
+            requeued = list(pending.values())
+            pending.clear()
+            for index, _, file_bytes, _, _, submitted in timed_out:
+                self.metrics.observe("file_processing", time.perf_counter() - submitted, size=len(file_bytes), error=True)
+                yield index, None, f"timed out after {timeout}s"
+            for index, file_extension, file_bytes, cache_key, _, submitted in requeued:
+                error = submit(index, file_extension, file_bytes, cache_key, submitted)
+                if error:
+                    yield index, None, error
+
+    def build_retrieval_indexes(self, uploaded_files, processed_files, page_range=None):
+        """Index the full text of each processed text upload for retrieval.
 
-    def save_chat_to_db(self, chat_data):
-        """Save chat to TinyDB with serializable data only"""
+        Returns the index keys of the text files in upload order. Indexes are
+        keyed like the extraction cache, so each document is indexed once."""
+        store = get_retrieval_store()
+        options = extraction_cache.extraction_options(page_range, full_text=True)
+        keys = []
+        for uploaded_file, content in zip(uploaded_files, processed_files):
+            if not isinstance(content, str) or not content:
+                continue
+            file_extension = uploaded_file.name.split('.')[-1].lower()
+            key = extraction_cache.ExtractionCache.make_key(uploaded_file.getvalue(), file_extension, options)
+            store.get_or_build(key, content)
+            keys.append(key)
+        return keys
+
+    def store_full_texts(self, uploaded_files, processed_files, page_range=None):
+        """Extraction cache keys of the whole documents behind truncated excerpts, in upload order.
+
+        Only files whose excerpt was cut at MAX_CONTENT_CHARS are extracted
+        again, and the keys are kept only if the uploads are then large enough
+        for the server-side context cache; otherwise every key is None and the
+        excerpts are all the model gets. The whole text stays in the
+        extraction cache, so session state never holds it."""
+        keys = [None] * len(uploaded_files)
+        truncated = [
+            index for index, content in enumerate(processed_files)
+            if isinstance(content, str) and len(content) >= extractors.MAX_CONTENT_CHARS
+        ]
+        if not truncated:
+            return keys
+        options = extraction_cache.extraction_options(page_range, full_text=True)
+        full_files = list(processed_files)
+        for position, content, error in self.process_uploaded_files(
+                [uploaded_files[index] for index in truncated], page_range=page_range, full_text=True):
+            if error:
+                # That file is sent as its excerpt
+                continue
+            index = truncated[position]
+            full_files[index] = content
+            file_extension = uploaded_files[index].name.split('.')[-1].lower()
+            keys[index] = extraction_cache.ExtractionCache.make_key(
+                uploaded_files[index].getvalue(), file_extension, options
+            )
+        parts = context_builder.file_context_parts([content for content in full_files if content is not None])
+        if context_builder.file_context_tokens(parts, self.token_counter) < get_context_cache().min_tokens:
+            return [None] * len(uploaded_files)
+        return keys
+
+    def serialize_message(self, msg):
+        """Keep only the serializable fields of a message (drops audio/image references)"""
+        return {
+            "role": msg["role"],
+            "content": msg["content"][:5000],
+            "timestamp": msg.get("timestamp", datetime.now().isoformat())
+        }
+
+    def save_chat_to_db(self, chat_data, incremental=True):
+        """Save chat to the configured storage backend with serializable data only.
+
+        In incremental mode only messages added since the last save of this chat
+        are serialized and appended, so a save costs the same at turn 5 or 500."""
         try:
             messages = chat_data.get('messages', [])
             chat_id = chat_data.get('chat_id', str(uuid.uuid4()))
-            
-            serializable_messages = []
-            for msg in messages:
-                # Exclude non-serializable data like image bytes before saving
-                clean_msg = {
-                    "role": msg["role"],
-                    "content": msg["content"][:5000],
-                    "timestamp": msg.get("timestamp", datetime.now().isoformat())
-                }
-                serializable_messages.append(clean_msg)
-            
-            clean_chat_data = {
-                "chat_id": chat_id,
-                "messages": serializable_messages,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            Chat = Query()
-            st.session_state.db.remove(Chat.chat_id == chat_id)
-            st.session_state.db.insert(clean_chat_data)
+            saved_counts = st.session_state.saved_message_counts
+            saved_count = saved_counts.get(chat_id, 0)
+
+            with self.metrics.timer("chat_save") as sample:
+                # History shorter than what we saved means it was rewritten; store it afresh
+                appended = False
+                if incremental and saved_count <= len(messages):
+                    serializable_messages = [self.serialize_message(msg) for msg in messages[saved_count:]]
+                    # Refused when the store no longer ends where our last save did (e.g. history cleared)
+                    appended = not serializable_messages or get_chat_storage().append_messages(
+                        chat_id, serializable_messages, saved_count, datetime.now().isoformat()
+                    )
+                if not appended:
+                    serializable_messages = [self.serialize_message(msg) for msg in messages]
+                    get_chat_storage().save_chat(chat_id, serializable_messages, datetime.now().isoformat())
+                sample["bytes"] = sum(len(msg["content"].encode('utf-8')) for msg in serializable_messages)
+
+            saved_counts[chat_id] = len(messages)
             
         except Exception as e:
             st.error(f"Error saving chat: {str(e)}")
@@ -437,81 +635,161 @@ class GeminiChat:
     def load_chat_history(self, chat_id):
         """Load chat history from DB"""
         try:
-            Chat = Query()
-            return st.session_state.db.search(Chat.chat_id == chat_id)
+            chat = get_chat_storage().load_chat(chat_id)
+            return [chat] if chat else []
         except:
             return []
 
-def create_audio(text, lang='en'):
-    """Create audio from text using gTTS"""
+@st.cache_resource(max_entries=1)
+def get_gemini_chat(api_key):
+    """One configured client and model pair for the whole process.
+
+    Keyed by the API key, so adding or rotating GEMINI_API_KEY takes effect
+    on the next rerun instead of keeping a stale (or key-less) client."""
+    return GeminiChat(api_key)
+
+def stream_response_text(response):
+    """Yield the text of each chunk of a (streamed) Gemini response"""
     try:
-        # Clean and limit text
-        clean_text = text.replace('\n', ' ').strip()[:1000]
-        if not clean_text:
-            return None
-            
-        tts = gTTS(text=clean_text, lang=lang, slow=False)
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            tts.save(tmp_file.name)
-            
-            # Read file and create BytesIO object
-            with open(tmp_file.name, 'rb') as f:
-                audio_bytes = f.read()
-            
-            # Clean up temp file
-            os.unlink(tmp_file.name)
-            
-            return audio_bytes
-            
-    except Exception as e:
-        st.error(f"Audio generation failed: {str(e)}")
-        return None
+        chunks = iter(response)
+    except TypeError:
+        # Already-resolved responses that can't be iterated come through whole
+        chunks = [response]
+
+    for chunk in chunks:
+        try:
+            text = chunk.text
+        except Exception:
+            # Chunks without text parts (e.g. safety metadata only) raise on .text
+            continue
+        if text:
+            yield text
+
+def render_streamed_response(response, placeholder):
+    """Paint streamed chunks into the assistant bubble and return the full text"""
+    response_text = ""
+    with get_metrics().timer("response_stream") as sample:
+        for text in stream_response_text(response):
+            response_text += text
+            placeholder.markdown(f"""
+            <div class="chat-message assistant-message">
+                <strong>🧠 Gemini:</strong> {html.escape(response_text)}▌
+            </div>
+            """, unsafe_allow_html=True)
+        sample["bytes"] = len(response_text.encode('utf-8'))
+    return response_text
+
+@st.cache_resource
+def get_audio_synthesizer():
+    """Process-wide background TTS worker and audio cache"""
+    # "gtts" (default) or "local" for the offline stand-in engine
+    engine_class = tts.TTS_ENGINES[st.secrets.get("TTS_ENGINE", "gtts")]
+    return tts.AudioSynthesizer(engine_class(), metrics=get_metrics())
+
+@st.fragment(run_every=1)
+def poll_pending_audio(audio_key):
+    """Placeholder for audio still being synthesized; reruns the app once it is ready"""
+    done, _ = get_audio_synthesizer().poll(audio_key)
+    if done:
+        st.rerun()
+    st.caption("🔊 Preparing audio...")
 
+# Artifacts are built at most once per distinct response text; str hashes are
+# cached on the string object, so cache lookups stay O(1) across reruns
+@functools.lru_cache(maxsize=DOWNLOAD_CACHE_SIZE)
 def create_download_options(content, content_type="text"):
-    """Create download options for different formats"""
+    """Create download options for different formats (memoized, treat the result as read-only)"""
     downloads = {}
     
     if content_type == "text" and content:
         try:
-            # Text file
-            downloads['txt'] = content.encode('utf-8')
-            
-            # Markdown file
-            downloads['md'] = f"# Gemini Response\n\n{content}".encode('utf-8')
-            
-            # JSON file
-            data = {
-                "response": content,
-                "timestamp": datetime.now().isoformat()
-            }
-            downloads['json'] = json.dumps(data, indent=2).encode('utf-8')
+            # Text, Markdown and JSON files
+            downloads = exports.response_downloads(content)
         except Exception as e:
             st.error(f"Error creating downloads: {str(e)}")
     
     return downloads
 
+def get_chat_export(messages, chat_id):
+    """Export of the current chat, rebuilt only when the chat has new messages"""
+    cached = st.session_state.get('chat_export')
+    if cached and cached[0] == chat_id and cached[1] == len(messages):
+        return cached[2]
+    chat_export = export_chat_history(messages, chat_id)
+    st.session_state.chat_export = (chat_id, len(messages), chat_export)
+    return chat_export
+
+def build_bulk_export(formats, dates=(), chat_ids=""):
+    """Stream the selected stored chats into a ZIP file on disk, showing progress; returns (path, counts)"""
+    import tempfile
+
+    # A single picked date is that day; a range is inclusive at both ends
+    start = dates[0].isoformat() if dates else None
+    end = dates[-1].isoformat() if dates else None
+    ids = [chat_id.strip() for chat_id in chat_ids.split(",") if chat_id.strip()] or None
+    progress_bar = st.progress(0.0, text="Exporting conversations...")
+
+    def progress(done, expected, messages):
+        # Redrawing for every chat would cost more than exporting it
+        if done % BULK_EXPORT_PROGRESS_EVERY and done != expected:
+            return
+        fraction = min(1.0, done / expected) if expected else 0.0
+        progress_bar.progress(fraction, text=f"{done} chats, {messages} messages exported")
+
+    previous = st.session_state.get('bulk_export')
+    if previous:
+        with contextlib.suppress(OSError):
+            os.remove(previous[0])
+    path = os.path.join(tempfile.gettempdir(), f"gemini_chats_{uuid.uuid4().hex}.zip")
+    try:
+        counts = exports.export_chats(get_chat_storage(), path, formats, start, end, ids, progress=progress)
+    except Exception as e:
+        st.error(f"Export failed: {str(e)}")
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        return None
+    progress_bar.empty()
+    return path, counts
+
+def read_bulk_export(path):
+    """The archive's bytes, for the deferred download button"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+def open_saved_chat(gemini_chat, chat_id, auto_save=True, incremental_save=True):
+    """Switch the session to a stored chat, saving the current one first if auto-save is on"""
+    if chat_id == st.session_state.chat_id:
+        return
+    chats = gemini_chat.load_chat_history(chat_id)
+    if not chats:
+        st.error("Couldn't load that conversation")
+        return
+    if auto_save and st.session_state.messages:
+        chat_data = {
+            'messages': st.session_state.messages,
+            'chat_id': st.session_state.chat_id
+        }
+        gemini_chat.save_chat_to_db(chat_data, incremental=incremental_save)
+
+    messages = chats[0]["messages"]
+    st.session_state.messages = messages
+    st.session_state.chat_id = chat_id
+    # Everything loaded is already stored, so the next save only appends
+    st.session_state.saved_message_counts[chat_id] = len(messages)
+    st.session_state.uploaded_files = []
+    st.session_state.retrieval_keys = []
+    st.session_state.full_text_keys = []
+    st.session_state.history_window = 0
+    st.rerun()
+
+def format_chat_time(timestamp):
+    return (timestamp or "")[:16].replace("T", " ")
+
 def export_chat_history(messages, chat_id):
     """Export chat history as JSON"""
     try:
         if messages:
-            # Create clean export data
-            export_messages = []
-            for msg in messages:
-                clean_msg = {
-                    "role": msg["role"],
-                    "content": msg["content"],
-                    "timestamp": msg.get("timestamp", datetime.now().isoformat())
-                }
-                export_messages.append(clean_msg)
-            
-            chat_data = {
-                "chat_id": chat_id,
-                "messages": export_messages,
-                "export_timestamp": datetime.now().isoformat()
-            }
-            return json.dumps(chat_data, indent=2).encode('utf-8')
+            return exports.chat_export(messages, chat_id)
     except Exception as e:
         st.error(f"Export failed: {str(e)}")
     return None
@@ -525,16 +803,15 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Initialize Gemini Chat
-    if 'gemini_chat' not in st.session_state:
-        st.session_state.gemini_chat = GeminiChat()
+    # Gemini Chat is a process-wide resource shared by all sessions
+    gemini_chat = get_gemini_chat(st.secrets.get("GEMINI_API_KEY", ""))
     
     # Sidebar
     with st.sidebar:
         st.header("🛠️ Features")
         
         # API Key check
-        if not st.session_state.gemini_chat.api_key:
+        if not gemini_chat.api_key:
             st.error("⚠️ Please add GEMINI_API_KEY to Streamlit secrets")
             return
         else:
@@ -545,20 +822,53 @@ def main():
         uploaded_files = st.file_uploader(
             "Upload documents, images, or data files",
             accept_multiple_files=True,
-            type=['txt', 'pdf', 'docx', 'md', 'csv', 'json', 'jpg', 'jpeg', 'png', 'gif', 'webp']
+            type=['txt', 'pdf', 'docx', 'md', 'csv', 'json', 'xlsx', 'jpg', 'jpeg', 'png', 'gif', 'webp']
         )
+        pdf_pages = st.text_input("PDF pages (optional)", placeholder="e.g. 1-5, 12, 80-")
+        try:
+            extractors.parse_page_range(pdf_pages)
+        except ValueError:
+            st.warning("⚠️ Couldn't read the page range, using all pages")
+            pdf_pages = ""
+        use_retrieval = st.checkbox("📚 Search whole documents", value=False,
+            help="Index full documents and send only the passages relevant to each question")
+        use_context_cache = st.checkbox("Cache Large Files Server-Side", value=False,
+            help="Upload large files to the model once and reuse them on later turns instead of resending them")
         
         # Process uploaded files
         if uploaded_files:
             with st.spinner("Processing files..."):
-                st.session_state.uploaded_files = []
-                for file in uploaded_files:
-                    try:
-                        processed_content = st.session_state.gemini_chat.process_uploaded_file(file)
-                        st.session_state.uploaded_files.append(processed_content)
-                        st.success(f"✅ {file.name}")
-                    except Exception as e:
-                        st.error(f"❌ {file.name}: {str(e)}")
+                # Results arrive in completion order; slot them back by index to keep upload order
+                processed_files = [None] * len(uploaded_files)
+                # Retrieval indexes whole documents, not the first MAX_CONTENT_CHARS
+                for index, processed_content, error in gemini_chat.process_uploaded_files(
+                        uploaded_files, page_range=pdf_pages, full_text=use_retrieval):
+                    if error:
+                        st.error(f"❌ {uploaded_files[index].name}: {error}")
+                    else:
+                        processed_files[index] = processed_content
+                        st.success(f"✅ {uploaded_files[index].name}")
+                st.session_state.retrieval_keys = []
+                full_text_keys = [None] * len(uploaded_files)
+                if use_retrieval:
+                    st.session_state.retrieval_keys = gemini_chat.build_retrieval_indexes(
+                        uploaded_files, processed_files, page_range=pdf_pages
+                    )
+                    # Whole documents now live in the index (retrieval turns skip the context
+                    # cache), so the session only keeps an excerpt
+                    processed_files = [
+                        content[:extractors.MAX_CONTENT_CHARS] if isinstance(content, str) else content
+                        for content in processed_files
+                    ]
+                elif use_context_cache:
+                    full_text_keys = gemini_chat.store_full_texts(uploaded_files, processed_files, page_range=pdf_pages)
+                # Images are kept as blob references, so the session doesn't hold their bytes
+                st.session_state.uploaded_files = [
+                    store_blob(content) for content in processed_files if content is not None
+                ]
+                st.session_state.full_text_keys = [
+                    key for content, key in zip(processed_files, full_text_keys) if content is not None
+                ]
         
         # Advanced Features
         st.subheader("🚀 Advanced Features")
@@ -566,7 +876,8 @@ def main():
         # Smart Context Management
         with st.expander("🧠 Smart Context"):
             context_length = st.slider("Context Messages", 3, 20, 5)
-            st.info("Maintains conversation context")
+            context_tokens = st.slider("Context Tokens", 1000, 32000, chat_engine.DEFAULT_CONTEXT_TOKENS, step=1000)
+            st.info("Maintains conversation context, most recent turns and most relevant file excerpts first")
         
         # Multi-language Support
         with st.expander("🌐 Language Options"):
@@ -575,25 +886,141 @@ def main():
         
         # Response Style
         with st.expander("✨ Response Style"):
-            response_style = st.selectbox("Style", 
-                ['Professional', 'Creative', 'Technical', 'Casual', 'Academic'])
+            response_style = st.selectbox("Style", chat_engine.RESPONSE_STYLES)
+        
+        # Chat Display
+        with st.expander("🖥️ Display"):
+            history_page_size = st.slider("Messages per page", 10, 100, 20, step=10)
+            show_render_stats = st.checkbox("Show render time", value=False)
+            # Never show fewer than one page, even if the page size was just raised
+            st.session_state.history_window = max(st.session_state.history_window, history_page_size)
         
         # Model Selection
         with st.expander("🤖 Model Options"):
+            request_mode = st.selectbox(
+                "Request Mode", list(REQUEST_MODE_LABELS),
+                format_func=REQUEST_MODE_LABELS.get,
+                help="Auto generates images only when asked for a picture, and analyzes uploaded files otherwise"
+            )
             use_fast_mode = st.checkbox("Fast Mode", value=False)
             st.info("Optimizes for speed over detail")
+            stream_responses = st.checkbox("Stream Responses", value=True)
+            st.info("Shows the answer as it is being written")
+            use_response_cache = st.checkbox("Cache Identical Requests", value=False)
+            if use_response_cache:
+                response_cache_stats = get_response_cache().stats()
+                st.caption(
+                    f"Response cache: {response_cache_stats['entries']} entries, "
+                    f"{response_cache_stats['hits']} hits / {response_cache_stats['misses']} misses"
+                )
         
         # Auto-save toggle
         with st.expander("💾 Storage Options"):
             auto_save = st.checkbox("Auto-save conversations", value=True)
+            incremental_save = st.checkbox("Incremental saves", value=True,
+                help="Only write messages added since the last save")
             if st.button("Clear All History", type="secondary"):
-                st.session_state.db.truncate()
+                get_chat_storage().clear()
+                st.session_state.history_cursors = []
+                st.session_state.history_search = None
+                # Nothing is stored any more, so the next save of each chat must write all of it
+                st.session_state.saved_message_counts = {}
                 st.success("History cleared!")
+
+            cache_stats = get_extraction_cache().stats()
+            st.caption(
+                f"File cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                f"({cache_stats['hit_rate']:.0%}), {cache_stats['bytes_saved'] / 1024 / 1024:.1f} MB parsing saved, "
+                f"{cache_stats['size_bytes'] / 1024 / 1024:.1f} of {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB used"
+            )
+            blob_stats = get_blob_store().stats()
+            st.caption(
+                f"Audio/image store: {blob_stats['size_bytes'] / 1024 / 1024:.1f} of "
+                f"{blob_stats['max_bytes'] / 1024 / 1024:.0f} MB used, {blob_stats['deduplicated']} duplicates skipped"
+            )
+        
+        # Bulk export of stored chats, streamed to a ZIP on disk one chat at a time
+        with st.expander("📦 Export All Conversations"):
+            export_formats = st.multiselect("Formats", list(exports.EXPORT_FORMATS), default=["jsonl"],
+                                            format_func=EXPORT_FORMAT_LABELS.get)
+            export_dates = st.date_input("Last saved between", value=(),
+                                         help="Leave empty to export conversations from any date")
+            export_ids = st.text_input("Chat IDs", placeholder="Optional, comma-separated")
+            if st.button("Build archive", disabled=not export_formats):
+                st.session_state.bulk_export = build_bulk_export(export_formats, export_dates, export_ids)
+            if st.session_state.get('bulk_export') and os.path.exists(st.session_state.bulk_export[0]):
+                export_path, export_counts = st.session_state.bulk_export
+                st.caption(f"{export_counts['chats']} chats, {export_counts['messages']} messages")
+                # Read only when clicked; passing the open file would load the whole ZIP on every rerun
+                st.download_button("📥 Download ZIP", functools.partial(read_bulk_export, export_path),
+                                   file_name="gemini_chats.zip", mime="application/zip")
+
+        # History browser: newest chats a page at a time, or full-text search over every message
+        with st.expander("🗂️ Chat History"):
+            history_query = st.text_input("Search conversations", placeholder="Search past messages...")
+            if history_query.strip():
+                # Reruns with the same query (any widget click) reuse the results; a new turn refreshes them
+                search_key = (history_query, st.session_state.chat_id, len(st.session_state.messages))
+                cached_search = st.session_state.get('history_search')
+                if cached_search and cached_search[0] == search_key:
+                    results = cached_search[1]
+                else:
+                    results = get_chat_storage().search_messages(history_query, limit=HISTORY_SEARCH_RESULTS)
+                    st.session_state.history_search = (search_key, results)
+                if not results:
+                    st.caption("No matching messages")
+                for j, result in enumerate(results):
+                    st.markdown(f"{'🧑' if result['role'] == 'user' else '🤖'} {result['snippet']}")
+                    if st.button(f"Open chat from {format_chat_time(result['timestamp'])}",
+                                 key=f"open_search_result_{j}"):
+                        open_saved_chat(gemini_chat, result['chat_id'], auto_save, incremental_save)
+            else:
+                cursors = st.session_state.history_cursors
+                # One extra row tells whether there is an older page
+                chats = get_chat_storage().list_chats(
+                    before=cursors[-1] if cursors else None, limit=HISTORY_PAGE_SIZE + 1
+                )
+                has_older = len(chats) > HISTORY_PAGE_SIZE
+                chats = chats[:HISTORY_PAGE_SIZE]
+                if not chats:
+                    st.caption("No saved conversations yet")
+                for chat in chats:
+                    label = f"{format_chat_time(chat['timestamp'])} · {chat['title'] or 'Untitled'} ({chat['message_count']})"
+                    if st.button(label, key=f"open_chat_{chat['chat_id']}", use_container_width=True):
+                        open_saved_chat(gemini_chat, chat['chat_id'], auto_save, incremental_save)
+                newer_col, older_col = st.columns(2)
+                with newer_col:
+                    if cursors and st.button("⬅️ Newer", key="history_newer"):
+                        cursors.pop()
+                        st.rerun()
+                with older_col:
+                    if has_older and st.button("Older ➡️", key="history_older"):
+                        cursors.append((chats[-1]['timestamp'], chats[-1]['chat_id']))
+                        st.rerun()
+        
+        # Diagnostics: where recent turns spent their time, across every session of this process
+        with st.expander("📈 Diagnostics"):
+            stage_rows = get_metrics().summary()
+            if stage_rows:
+                st.dataframe(stage_rows, hide_index=True, use_container_width=True)
+                st.caption("Percentiles over each stage's most recent runs, all sessions")
+                st.download_button(
+                    "📥 Prometheus metrics",
+                    get_metrics().prometheus_text(),
+                    file_name="gemini_chat_metrics.prom",
+                    mime="text/plain"
+                )
+                if st.button("Reset metrics"):
+                    get_metrics().reset()
+                    st.rerun()
+            else:
+                st.caption("No timings recorded yet")
         
         # Export Options
         st.subheader("💾 Export & Download")
-        if st.session_state.messages:
-            chat_export = export_chat_history(st.session_state.messages, st.session_state.chat_id)
+        # Only build the export once asked for, and then only when the chat has changed
+        if st.session_state.messages and st.toggle("📦 Prepare chat export", key="prepare_chat_export"):
+            chat_export = get_chat_export(st.session_state.messages, st.session_state.chat_id)
             if chat_export:
                 st.download_button(
                     "📥 Download Chat",
@@ -610,16 +1037,27 @@ def main():
                     'messages': st.session_state.messages,
                     'chat_id': st.session_state.chat_id
                 }
-                st.session_state.gemini_chat.save_chat_to_db(chat_data)
+                gemini_chat.save_chat_to_db(chat_data, incremental=incremental_save)
             
             st.session_state.messages = []
             st.session_state.chat_id = str(uuid.uuid4())
             st.session_state.uploaded_files = []
+            st.session_state.retrieval_keys = []
+            st.session_state.full_text_keys = []
+            st.session_state.history_window = 0
             st.rerun()
     
     # Main Chat Interface
-    # Display Chat Messages
-    for i, message in enumerate(st.session_state.messages):
+    # Display Chat Messages - only the most recent window is materialized
+    render_start = time.perf_counter()
+    total_messages = len(st.session_state.messages)
+    first_shown = max(0, total_messages - st.session_state.history_window)
+    if first_shown > 0:
+        if st.button(f"⬆️ Load earlier messages ({first_shown} hidden)", key="load_earlier_messages"):
+            st.session_state.history_window += history_page_size
+            st.rerun()
+
+    for i, message in enumerate(st.session_state.messages[first_shown:], start=first_shown):
         if message["role"] == "user":
             st.markdown(f"""
             <div class="chat-message user-message">
@@ -639,16 +1077,35 @@ def main():
             
             """, unsafe_allow_html=True)
 
-            # Display generated image if it exists
-            if "image_data" in message and message["image_data"]:
-                st.image(message["image_data"], caption="Image generated by Gemini")
+            if message.get("cached"):
+                st.caption("⚡ Answered from cache")
+
+            # Display generated image if it exists (its bytes live in the blob store)
+            if message.get("image_ref"):
+                image_bytes = get_blob_store().get(message["image_ref"])
+                if image_bytes:
+                    st.image(image_bytes, caption="Image generated by Gemini")
+
+            # Attach background-synthesized audio once it's ready, as a blob reference
+            if message.get("audio_key") and "audio_ref" not in message:
+                synthesizer = get_audio_synthesizer()
+                done, audio_bytes = synthesizer.poll(message["audio_key"])
+                if done:
+                    # None on failure, which also stops the polling
+                    message["audio_ref"] = (
+                        get_blob_store().put(audio_bytes, synthesizer.engine.mime_type) if audio_bytes else None
+                    )
+                else:
+                    poll_pending_audio(message["audio_key"])
 
             # Audio playback for assistant messages
-            if "audio_bytes" in message and message["audio_bytes"]:
-                st.audio(message["audio_bytes"])
+            if message.get("audio_ref"):
+                audio_bytes = get_blob_store().get(message["audio_ref"])
+                if audio_bytes:
+                    st.audio(audio_bytes, format=message["audio_ref"]["mime_type"])
 
-            # Download options
-            if message["content"]:
+            # Download options, built only for messages the user opens them on
+            if message["content"] and st.toggle("📥 Downloads", key=f"show_downloads_{st.session_state.chat_id}_{i}"):
                 downloads = create_download_options(message["content"])
                 if downloads:
                     cols = st.columns(len(downloads))
@@ -668,6 +1125,11 @@ def main():
             
             # Download options
             
+    render_seconds = time.perf_counter() - render_start
+    get_metrics().observe("render", render_seconds)
+    if show_render_stats and total_messages:
+        render_ms = render_seconds * 1000
+        st.caption(f"Rendered {total_messages - first_shown} of {total_messages} messages in {render_ms:.0f} ms")
     
     # Chat Input
     prompt = st.chat_input("Ask Gemini anything... (supports image generation, file analysis, and more!)")
@@ -680,22 +1142,41 @@ def main():
             "timestamp": datetime.now().isoformat()
         }
         st.session_state.messages.append(user_message)
+
+        # When streaming, paint the new turn right away; the rerun below redraws it from history
+        stream_placeholder = None
+        if stream_responses:
+            st.markdown(f"""
+            <div class="chat-message user-message">
+                <strong>You:</strong> {prompt}
+            </div>
+            """, unsafe_allow_html=True)
+            stream_placeholder = st.empty()
+            stream_placeholder.markdown("""
+            <div class="chat-message assistant-message">
+                <strong>🧠 Gemini:</strong> 🧠 Gemini is thinking...
+            </div>
+            """, unsafe_allow_html=True)
         
         # Show typing indicator and generate response
-        with st.spinner("🧠 Gemini is thinking..."):
+        with (contextlib.nullcontext() if stream_responses else st.spinner("🧠 Gemini is thinking...")):
             try:
                 # Prepare context and files
                 context = st.session_state.messages[-context_length:] if len(st.session_state.messages) > 1 else None
-                files = st.session_state.uploaded_files if st.session_state.uploaded_files else None
+                files = resolve_files(st.session_state.uploaded_files) if st.session_state.uploaded_files else None
+                full_files = None
+                if files and use_context_cache and any(st.session_state.full_text_keys):
+                    full_files = resolve_full_texts(st.session_state.uploaded_files, st.session_state.full_text_keys)
                 
                 # Add response style to prompt
-                styled_prompt = f"[{response_style} style] {prompt}"
-                if use_fast_mode:
-                    styled_prompt = f"[Brief response] {styled_prompt}"
+                styled_prompt = chat_engine.style_prompt(prompt, response_style, brief=use_fast_mode)
                 
                 # Generate response
-                response, response_type = st.session_state.gemini_chat.generate_response(
-                    styled_prompt, files, context
+                response, response_type = gemini_chat.generate_response(
+                    styled_prompt, files, context, stream=stream_responses, context_tokens=context_tokens,
+                    retrieval_keys=st.session_state.retrieval_keys if files else None,
+                    use_cache=use_response_cache, use_context_cache=use_context_cache, mode=request_mode,
+                    full_files=full_files
                 )
                 
                 # Process response
@@ -703,14 +1184,15 @@ def main():
                     response_text = response
                 elif response_type == "image":
                     response_text = response.text if hasattr(response, 'text') else "Image generated successfully!"
-                    # Handle image display here if needed
+                elif stream_responses:
+                    response_text = render_streamed_response(response, stream_placeholder)
                 else:
                     response_text = response.text if hasattr(response, 'text') else str(response)
                 
-                # Create audio
-                audio_bytes = None
+                # Start audio in the background; the render loop attaches it when ready
+                audio_key = None
                 if response_text and len(response_text.strip()) > 0:
-                    audio_bytes = create_audio(response_text, audio_lang)
+                    audio_key = get_audio_synthesizer().submit(response_text, audio_lang)
                 
                 # Add assistant message
                 assistant_message = {
@@ -719,8 +1201,16 @@ def main():
                     "timestamp": datetime.now().isoformat()
                 }
                 
-                if audio_bytes:
-                    assistant_message["audio_bytes"] = audio_bytes
+                if audio_key:
+                    assistant_message["audio_key"] = audio_key
+
+                if response_type == "image":
+                    image = chat_engine.response_image(response)
+                    if image:
+                        assistant_message["image_ref"] = get_blob_store().put(*image)
+
+                if getattr(response, "from_cache", False):
+                    assistant_message["cached"] = True
                 
                 st.session_state.messages.append(assistant_message)
                 
@@ -730,7 +1220,7 @@ def main():
                         'messages': st.session_state.messages,
                         'chat_id': st.session_state.chat_id
                     }
-                    st.session_state.gemini_chat.save_chat_to_db(chat_data)
+                    gemini_chat.save_chat_to_db(chat_data, incremental=incremental_save)
                 
             except Exception as e:
                 error_message = {
@@ -756,7 +1246,7 @@ def main():
             st.metric("Files Uploaded", len(st.session_state.uploaded_files))
         with col3:
             try:
-                total_chats = len(st.session_state.db.all())
+                total_chats = get_chat_storage().count_chats()
                 st.metric("Total Conversations", total_chats)
             except:
                 st.metric("Total Conversations", "N/A")
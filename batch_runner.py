@@ -0,0 +1,279 @@
+"""Run a JSONL file of prompts through the chat's prompting, without the UI.
+
+Each input line is a JSON object:
+
+    {"id": "q1", "prompt": "Summarize the report", "style": "Technical",
+     "brief": false, "files": ["docs/report.pdf"], "mode": "auto",
+     "context": [{"role": "user", "content": "..."}, ...]}
+
+Only "prompt" is required; "id" defaults to the line number, and "mode"
+(auto, text, image or file_analysis) to auto. Prompts go
+through chat_engine.ChatEngine.generate_response, so style prefixes, file
+extraction and token-budgeted context match the chat exactly. Up to
+--concurrency prompts run at once, behind the same rate-limited request
+engine the app uses.
+
+Results are appended to the output JSONL as they finish, which doubles as
+the checkpoint: rerunning the same command skips ids already answered
+successfully, so an interrupted job picks up where it stopped. Ctrl-C stops
+submitting and writes out the prompts already in flight; a second Ctrl-C
+aborts immediately.
+
+    python batch_runner.py prompts.jsonl -o results.jsonl --model fake
+    GEMINI_API_KEY=... python batch_runner.py prompts.jsonl -o results.jsonl --concurrency 4 --rpm 60
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+import chat_engine
+import extraction_cache
+import extractors
+import request_engine
+from metrics import percentile
+
+
+def read_prompts(path):
+    """Yield (id, job) for each non-blank line of the prompts file"""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            if "prompt" not in job:
+                raise ValueError(f"{path}:{line_number}: missing \"prompt\"")
+            yield str(job.get("id", line_number)), job
+
+
+def load_checkpoint(path):
+    """Ids already answered successfully in an existing output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption; that prompt just runs again
+                continue
+            if result.get("status") == "ok":
+                done.add(result["id"])
+    return done
+
+
+def open_output(path):
+    """Open the output for appending, first completing a line an interruption cut short"""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            ends_with_newline = f.read(1) == b"\n"
+        if not ends_with_newline:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n")
+    return open(path, "a", encoding="utf-8")
+
+
+def load_file(path, file_cache=None):
+    """Extract an attachment, through file_cache (an ExtractionCache) if given.
+
+    The cache is the app's, so an attachment is parsed once however many
+    prompts, runs or chat sessions share it."""
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    file_extension = path.rsplit('.', 1)[-1].lower()
+    if file_cache is None:
+        return chat_engine.load_extracted_content(extractors.extract_content(file_bytes, file_extension))
+    key = file_cache.make_key(file_bytes, file_extension)
+    content = file_cache.get(key, source_size=len(file_bytes))
+    if content is None:
+        content = chat_engine.load_extracted_content(extractors.extract_content(file_bytes, file_extension))
+        file_cache.put(key, content)
+    return content
+
+
+def run_prompt(engine, job, context_tokens, use_cache, use_context_cache=False, file_cache=None):
+    """Answer one job; returns the result record written to the output"""
+    start = time.perf_counter()
+    try:
+        files = [load_file(path, file_cache) for path in job.get("files", [])] or None
+        prompt = chat_engine.style_prompt(job["prompt"], job.get("style", "Professional"), job.get("brief", False))
+        response, response_type = engine.generate_response(
+            prompt, files, job.get("context") or None,
+            context_tokens=job.get("context_tokens", context_tokens), use_cache=use_cache,
+            use_context_cache=use_context_cache, mode=job.get("mode", "auto")
+        )
+        if response_type == "error":
+            raise RuntimeError(response)
+        text = response.text if hasattr(response, 'text') else str(response)
+        result = {"status": "ok", "type": response_type, "response": text,
+                  "cached": getattr(response, "from_cache", False), "route": engine.last_route}
+    except Exception as e:
+        result = {"status": "error", "error": str(e)}
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+def build_engine(args):
+    """A ChatEngine for --model: the offline fake, or a real Gemini model"""
+    if args.model == "fake":
+        import fake_gemini
+
+        text_model = fake_gemini.FakeGenerativeModel(latency=args.fake_latency, failure_rate=args.fake_failure_rate)
+        image_model = text_model
+        api_key = "fake"
+    else:
+        import google.generativeai as genai
+
+        api_key = os.environ.get("GEMINI_API_KEY", "")
+        if not api_key:
+            raise SystemExit("GEMINI_API_KEY is not set (use --model fake to run offline)")
+        genai.configure(api_key=api_key)
+        text_model = image_model = genai.GenerativeModel(args.model)
+
+    cache = None
+    if args.cache:
+        import response_cache
+
+        cache = response_cache.ResponseCache(args.cache)
+    context = None
+    if args.context_cache:
+        import context_cache
+
+        # Prompts sharing attachments send them once, as a cached context
+        backend = fake_gemini.FakeCacheBackend() if args.model == "fake" else None
+        context = context_cache.ContextCache(backend)
+    # The fake model has no quota to protect, so it isn't throttled unless asked
+    rpm = args.rpm or (60000 if args.model == "fake" else 30)
+    engine = request_engine.RequestEngine(
+        requests_per_minute=rpm, burst=args.concurrency, max_concurrency=args.concurrency
+    )
+    return chat_engine.ChatEngine(text_model, image_model, api_key=api_key,
+                                  request_engine=engine, response_cache=cache, context_cache=context)
+
+
+def run_batch(engine, jobs, output, concurrency, context_tokens=chat_engine.DEFAULT_CONTEXT_TOKENS,
+              use_cache=False, done=frozenset(), progress=None, stop=None, use_context_cache=False,
+              file_cache=None):
+    """Run jobs ((id, job) pairs) with at most concurrency in flight, appending results to output.
+
+    Jobs are read lazily, so the prompts file is never held in memory. Once
+    the stop event is set no new jobs start; those in flight are finished
+    and written. Returns the summary statistics.
+    """
+    latencies = []
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    started = time.perf_counter()
+    jobs = iter(jobs)
+    pending = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        while True:
+            # Keep the window full, then write out whatever has finished
+            while len(pending) < concurrency and not (stop and stop.is_set()):
+                job_id, job = next(jobs, (None, None))
+                if job is None:
+                    break
+                if job_id in done:
+                    counts["skipped"] += 1
+                    continue
+                pending[executor.submit(
+                    run_prompt, engine, job, context_tokens, use_cache, use_context_cache, file_cache
+                )] = job_id
+            if not pending:
+                break
+            finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                result = dict(id=pending.pop(future), **future.result())
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                counts[result["status"]] += 1
+                latencies.append(result["latency_ms"])
+            output.flush()
+            if progress:
+                progress(counts)
+    if stop and stop.is_set():
+        counts["interrupted"] = True
+
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    completed = counts["ok"] + counts["error"]
+    return dict(
+        counts,
+        elapsed_seconds=round(elapsed, 3),
+        throughput_per_second=round(completed / elapsed, 2) if elapsed else 0.0,
+        latency_ms={
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the chat's prompting")
+    parser.add_argument("prompts", help="input JSONL, one {\"prompt\": ...} object per line")
+    parser.add_argument("-o", "--output", required=True, help="output JSONL; also the resume checkpoint")
+    parser.add_argument("--model", default="gemini-2.0-flash-lite", help='Gemini model name, or "fake" to run offline')
+    parser.add_argument("--concurrency", type=int, default=4, help="prompts in flight at once")
+    parser.add_argument("--rpm", type=int, help="requests per minute allowed by the rate limiter (default 30)")
+    parser.add_argument("--context-tokens", type=int, default=chat_engine.DEFAULT_CONTEXT_TOKENS)
+    parser.add_argument("--cache", metavar="PATH", help="answer identical requests from this response cache")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="send large attachments once as a server-side cached context")
+    parser.add_argument("--extraction-cache", metavar="DIR", default=extraction_cache.DEFAULT_CACHE_DIR,
+                        help="directory of extracted attachments, shared with the app (\"\" to disable)")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and run every prompt")
+    parser.add_argument("--summary", metavar="PATH", help="also write the summary statistics to this file")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="seconds per call of the fake model")
+    parser.add_argument("--fake-failure-rate", type=float, default=0.0, help="share of fake calls that get a 429")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    if done:
+        print(f"Resuming: {len(done)} prompts already answered", file=sys.stderr)
+
+    def progress(counts):
+        print(f"\r{counts['ok']} ok, {counts['error']} failed", end="", file=sys.stderr, flush=True)
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print("\nStopping after the prompts in flight (Ctrl-C again to abort)", file=sys.stderr)
+        stop.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    engine = build_engine(args)
+    file_cache = extraction_cache.ExtractionCache(args.extraction_cache) if args.extraction_cache else None
+    signal.signal(signal.SIGINT, request_stop)
+    with open_output(args.output) as output:
+        summary = run_batch(engine, read_prompts(args.prompts), output, args.concurrency, args.context_tokens,
+                            use_cache=bool(args.cache), done=done, progress=progress, stop=stop,
+                            use_context_cache=args.context_cache, file_cache=file_cache)
+    engine.get_request_engine().close()
+    summary["stages"] = engine.metrics.summary()
+    print(file=sys.stderr)
+
+    latency = summary["latency_ms"]
+    print(f"{summary['ok']} ok, {summary['error']} failed, {summary['skipped']} skipped "
+          f"in {summary['elapsed_seconds']:.1f}s ({summary['throughput_per_second']:.2f} prompts/s)")
+    if latency["p50"] is not None:
+        print(f"latency p50 {latency['p50']:.0f} ms, p90 {latency['p90']:.0f} ms, "
+              f"p99 {latency['p99']:.0f} ms, max {latency['max']:.0f} ms")
+    if summary.get("interrupted"):
+        print("Interrupted; rerun the same command to resume")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if summary.get("interrupted"):
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
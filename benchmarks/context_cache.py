@@ -0,0 +1,158 @@
+"""Bytes sent per turn with and without the server-side context cache.
+
+Uploads one large synthetic document through the app's own path
+(GeminiChat.process_uploaded_files) and runs the same conversation about it,
+offline: app.py is imported in Streamlit's bare mode with fake_gemini's model
+and cache backend swapped in. Three runs:
+
+- excerpt: "Cache Large Files Server-Side" off, so only the first
+  MAX_CONTENT_CHARS of the document are extracted and sent every turn
+- inline: the whole document extracted and sent every turn
+- context_cache: the checkbox on; the excerpt is kept in the session and the
+  whole document, extracted again behind an extraction cache key
+  (GeminiChat.store_full_texts), is sent once as a cached context
+
+Reports how much of the document each run gave the model, the request bytes
+of each turn and the totals, including the one-off upload that created the
+cache.
+
+    python benchmarks/context_cache.py --turns 20 --doc-kb 200 --json context_cache.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import chat_engine  # noqa: E402
+import context_cache  # noqa: E402
+import fake_gemini  # noqa: E402
+
+
+class UploadedDocument:
+    """The part of Streamlit's UploadedFile that GeminiChat reads"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def getvalue(self):
+        return self.data
+
+
+def synthetic_document(kilobytes):
+    paragraph = ("Quarterly revenue grew in every region while operating costs stayed flat; "
+                 "the appendix breaks the figures down by product line and month. ")
+    paragraphs = []
+    size = 0
+    for number in range(1, 1000000):
+        text = f"Section {number}. {paragraph * 3}"
+        paragraphs.append(text)
+        size += len(text) + 2
+        if size >= kilobytes * 1024:
+            break
+    return "\n\n".join(paragraphs)
+
+
+def import_app(workdir):
+    """app.py in bare mode, with secrets and its on-disk caches under workdir and an offline model"""
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        f.write('GEMINI_API_KEY = "fake"\nGEMINI_RPM = 600000\n')
+    # Streamlit reads secrets and the app its caches relative to the working directory
+    os.chdir(workdir)
+    import google.generativeai as genai
+
+    genai.GenerativeModel = lambda model_name, **kwargs: fake_gemini.FakeGenerativeModel(
+        model_name=f"models/{model_name}", latency=0
+    )
+    import app
+
+    return app
+
+
+def run_conversation(app, upload, turns, full_text, use_context_cache, context_tokens):
+    """Bytes the model received on each turn, and what creating caches uploaded"""
+    backend = fake_gemini.FakeCacheBackend()
+    cache = context_cache.ContextCache(backend)
+    app.get_context_cache = lambda: cache
+    gemini_chat = app.GeminiChat("fake")
+
+    files = []
+    for _, content, error in gemini_chat.process_uploaded_files([upload], full_text=full_text):
+        if error:
+            raise RuntimeError(error)
+        files.append(content)
+    full_files = None
+    if use_context_cache:
+        full_text_keys = gemini_chat.store_full_texts([upload], files)
+        if any(full_text_keys):
+            full_files = app.resolve_full_texts(files, full_text_keys)
+
+    model = gemini_chat.text_model
+    history = []
+    per_turn = []
+    for turn in range(turns):
+        prompt = chat_engine.style_prompt(f"Question {turn + 1}: how did section {turn + 3} change?")
+        before = model.bytes_received
+        response, response_type = gemini_chat.generate_response(
+            prompt, files, history[-10:] or None, context_tokens=context_tokens,
+            use_context_cache=use_context_cache, full_files=full_files,
+        )
+        if response_type == "error":
+            raise RuntimeError(response)
+        per_turn.append(model.bytes_received - before)
+        history += [{"role": "user", "content": prompt}, {"role": "assistant", "content": response.text}]
+    return {
+        "document_chars": sum(len(content) for content in full_files or files),
+        "bytes_per_turn": per_turn,
+        "request_bytes": sum(per_turn),
+        "cache_upload_bytes": backend.bytes_uploaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--doc-kb", type=int, default=200, help="size of the synthetic document")
+    parser.add_argument("--context-tokens", type=int, default=100000,
+                        help="budget large enough that the inline run sends everything it extracted")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to this file")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    document = synthetic_document(args.doc_kb)
+    upload = UploadedDocument("report.txt", document.encode("utf-8"))
+    with tempfile.TemporaryDirectory(prefix="context_cache_bench_") as workdir:
+        cwd = os.getcwd()
+        try:
+            app = import_app(workdir)
+            results = {
+                "excerpt": run_conversation(app, upload, args.turns, False, False, args.context_tokens),
+                "inline": run_conversation(app, upload, args.turns, True, False, args.context_tokens),
+                "context_cache": run_conversation(app, upload, args.turns, False, True, args.context_tokens),
+            }
+            app.get_request_engine().close()
+        finally:
+            os.chdir(cwd)
+
+    print(f"Document: {len(document):,} characters")
+    for name, result in results.items():
+        total = result["request_bytes"] + result["cache_upload_bytes"]
+        per_turn = result["bytes_per_turn"]
+        print(f"{name:>13}: {result['document_chars']:9,} characters extracted, "
+              f"{per_turn[0] / 1024:8.1f} KB first turn, {per_turn[-1] / 1024:8.1f} KB last turn, "
+              f"{total / 1024:9.1f} KB total over {len(per_turn)} turns")
+    inline_total = results["inline"]["request_bytes"]
+    cached_total = results["context_cache"]["request_bytes"] + results["context_cache"]["cache_upload_bytes"]
+    print(f"Context cache sends {cached_total / inline_total:.1%} of the bytes of sending the whole document inline")
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
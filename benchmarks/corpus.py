@@ -0,0 +1,146 @@
+"""Synthetic, reproducible inputs for the benchmarks.
+
+Everything is generated from a seeded random.Random, so two runs with the
+same sizes and seed see byte-identical files and histories. PDFs and DOCX
+files are written by hand (no PDF or Word library needed to create them,
+only to parse them).
+"""
+import csv
+import io
+import json
+import random
+import zipfile
+from datetime import datetime, timedelta
+
+WORDS = (
+    "revenue growth quarter region product customer forecast margin report analysis market "
+    "cost budget team launch strategy risk update summary data model result review plan "
+    "increase decrease stable trend metric target pipeline contract support release survey"
+).split()
+
+
+def sentence(rng, words=12):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def paragraph(rng, sentences=5):
+    return " ".join(sentence(rng, rng.randint(8, 16)) for _ in range(sentences))
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages=20, seed=0, lines_per_page=40):
+    """A text PDF of the given page count"""
+    rng = random.Random(seed)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for _ in range(pages):
+        lines = [_pdf_escape(sentence(rng, 10)) for _ in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 12 TL 40 760 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+    return out.getvalue()
+
+
+DOCX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+DOCX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+
+def make_docx(paragraphs=200, seed=0):
+    """A minimal Word document with the given number of paragraphs"""
+    rng = random.Random(seed)
+    body = "".join(f"<w:p><w:r><w:t>{paragraph(rng)}</w:t></w:r></w:p>" for _ in range(paragraphs))
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{body}</w:body></w:document>")
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        docx.writestr("_rels/.rels", DOCX_RELS)
+        docx.writestr("word/document.xml", document)
+    return out.getvalue()
+
+
+def make_records(count, seed=0):
+    """Rows of mixed numeric, categorical, date and free-text columns"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for number in range(count):
+        yield {
+            "id": number,
+            "region": rng.choice(["north", "south", "east", "west"]),
+            "product": rng.choice(WORDS),
+            "units": rng.randint(0, 500),
+            "price": round(rng.uniform(1, 250), 2),
+            "date": (start + timedelta(minutes=number * 7)).isoformat(),
+            "note": sentence(rng, 6) if rng.random() < 0.8 else "",
+        }
+
+
+def make_csv(rows=10000, seed=0):
+    out = io.StringIO()
+    writer = None
+    for record in make_records(rows, seed):
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(record))
+            writer.writeheader()
+        writer.writerow(record)
+    return out.getvalue().encode("utf-8")
+
+
+def make_json(records=5000, seed=0):
+    return json.dumps(list(make_records(records, seed))).encode("utf-8")
+
+
+def make_history(messages=100, seed=0):
+    """Alternating user/assistant messages shaped like the app's session messages"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    history = []
+    for number in range(messages):
+        role = "user" if number % 2 == 0 else "assistant"
+        content = sentence(rng, 14) if role == "user" else "\n\n".join(paragraph(rng) for _ in range(3))
+        history.append({
+            "role": role,
+            "content": content,
+            "timestamp": (start + timedelta(seconds=30 * number)).isoformat(),
+        })
+    return history
+
+
+# extension -> generator(size, seed) for the extraction stages
+FILE_GENERATORS = {
+    "pdf": make_pdf,
+    "docx": make_docx,
+    "csv": make_csv,
+    "json": make_json,
+}
@@ -0,0 +1,109 @@
+"""Cold-start import benchmark for app.py.
+
+Times, in fresh interpreters, the module-level imports app.py does today
+(read from its source) against the eager import list it used to have, when
+every extractor, gTTS, markdown and zipfile were imported up front. Streamlit
+caches imports within a process, so this is the cost each new worker pays.
+
+    python benchmarks/startup.py --runs 7 --json startup.json
+
+Modules that aren't installed are reported and left out of both timings.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+
+# What app.py imported at module level before extractors and TTS became lazy
+EAGER_IMPORTS = [
+    "streamlit", "google.generativeai", "tinydb", "json", "base64", "io", "PIL.Image",
+    "tempfile", "os", "html", "datetime", "re", "uuid", "time", "gtts", "pandas",
+    "docx", "PyPDF2", "markdown", "zipfile",
+]
+
+TIMER = """
+import importlib, json, sys, time
+sys.path.insert(0, {repo_dir!r})
+missing = []
+start = time.perf_counter()
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        missing.append(name)
+print(json.dumps({{"seconds": time.perf_counter() - start, "missing": missing}}))
+"""
+
+
+def app_imports(path=APP_PATH):
+    """Modules app.py imports at module level, in source order"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def time_imports(modules, runs):
+    """Import modules in `runs` fresh interpreters; returns (timings in seconds, missing modules)"""
+    timings = []
+    missing = set()
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", TIMER.format(repo_dir=REPO_DIR, modules=modules)],
+            capture_output=True, text=True, check=True, cwd=REPO_DIR,
+        )
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(report["seconds"])
+        missing.update(report["missing"])
+    return timings, sorted(missing)
+
+
+def summarize(timings):
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "max_ms": max(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    lazy_modules = app_imports()
+    eager_timings, eager_missing = time_imports(EAGER_IMPORTS, args.runs)
+    lazy_timings, lazy_missing = time_imports(lazy_modules, args.runs)
+
+    results = {
+        "runs": args.runs,
+        "before": dict(summarize(eager_timings), modules=EAGER_IMPORTS, missing=eager_missing),
+        "after": dict(summarize(lazy_timings), modules=lazy_modules, missing=lazy_missing),
+    }
+
+    for label in ("before", "after"):
+        row = results[label]
+        print(f"{label:>6}: median {row['median_ms']:7.1f} ms  "
+              f"(min {row['min_ms']:.1f}, max {row['max_ms']:.1f}) over {args.runs} runs")
+        if row["missing"]:
+            print(f"        not installed, skipped: {', '.join(row['missing'])}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Benchmark suite for the chat's hot paths, offline and reproducible.
+
+Generates synthetic PDF, DOCX, CSV and JSON files and a chat history (see
+corpus.py), swaps in fake_gemini's model and the local TTS engine, and
+times each stage: file extraction per format, context assembly, response
+generation, speech synthesis, saving, download artifacts, and a full
+simulated turn. With Streamlit installed it also drives app.py itself
+through streamlit.testing: a rerun that renders the history, and a turn
+submitted through the chat input.
+
+Each stage reports throughput, p50/p99 latency and the peak memory one run
+allocates (measured with tracemalloc on a separate run, so it doesn't skew
+the timings). Results are written as JSON; --baseline compares against an
+earlier run and flags stages that got slower or hungrier.
+
+    python benchmarks/suite.py --runs 20 --json baseline.json
+    python benchmarks/suite.py --runs 20 --json current.json --baseline baseline.json
+
+Stages whose libraries aren't installed are reported and skipped.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "app.py")
+sys.path.insert(0, REPO_DIR)
+
+import chat_engine  # noqa: E402
+import context_builder  # noqa: E402
+import corpus  # noqa: E402
+import exports  # noqa: E402
+import extractors  # noqa: E402
+import fake_gemini  # noqa: E402
+import request_engine  # noqa: E402
+import storage  # noqa: E402
+import tts  # noqa: E402
+from metrics import percentile  # noqa: E402
+
+# A stage is flagged when its p50 latency or peak memory grows by more than this
+DEFAULT_THRESHOLD = 0.15
+
+
+class StageSkipped(Exception):
+    """Raised by a stage that can't run here (e.g. its parser isn't installed)"""
+
+
+def measure(run, runs, warmup=1):
+    """Time runs calls of run(index), then measure one more under tracemalloc"""
+    for index in range(warmup):
+        run(-1 - index)
+    durations = []
+    for index in range(runs):
+        start = time.perf_counter()
+        run(index)
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run(runs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(durations)
+    durations_ms = sorted(seconds * 1000 for seconds in durations)
+    return {
+        "runs": runs,
+        "throughput_per_second": round(runs / total, 2) if total else None,
+        "mean_ms": round(total * 1000 / runs, 3),
+        "p50_ms": round(percentile(durations_ms, 0.50), 3),
+        "p99_ms": round(percentile(durations_ms, 0.99), 3),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def build_engine(args):
+    model = fake_gemini.FakeGenerativeModel(latency=args.model_latency)
+    return chat_engine.ChatEngine(
+        model, model, api_key="fake",
+        request_engine=request_engine.RequestEngine(requests_per_minute=600000, burst=1000),
+    )
+
+
+def core_stages(args, files, history, workdir):
+    """(name, run(index)) for every Streamlit-free stage"""
+    stages = []
+
+    def extraction(extension, file_bytes):
+        def run(index):
+            try:
+                extractors.extract_content(file_bytes, extension)
+            except ImportError as e:
+                raise StageSkipped(f"{e.name} not installed")
+        return run
+
+    for extension, file_bytes in files.items():
+        stages.append((f"extract_{extension}", extraction(extension, file_bytes)))
+
+    # What the uploads look like in the session once extracted (unparseable formats left out)
+    uploaded = []
+    for extension, file_bytes in files.items():
+        try:
+            uploaded.append(chat_engine.load_extracted_content(extractors.extract_content(file_bytes, extension)))
+        except ImportError:
+            pass
+
+    engine = build_engine(args)
+    counter = context_builder.TokenCounter(lambda text: engine.text_model.count_tokens(text).total_tokens)
+    context = history[-args.context_length:]
+
+    def context_build(index):
+        context_builder.build_model_input(
+            f"Question {index}: what changed in the forecast?", uploaded, context, counter, args.context_tokens
+        )
+
+    def generate(index):
+        response, response_type = engine.generate_response(
+            chat_engine.style_prompt(f"Question {index}: what changed in the forecast?"), uploaded, context,
+            context_tokens=args.context_tokens,
+        )
+        if response_type == "error":
+            raise RuntimeError(response)
+        return response.text
+
+    # Distinct text per run, so every run synthesizes instead of hitting the audio cache
+    synthesizer = tts.AudioSynthesizer(tts.LocalToneEngine())
+    tts_text = history[1]["content"][:args.tts_chars]
+
+    def synthesize(index):
+        synthesizer.synthesize(f"{index} {tts_text}")
+
+    chat_store = storage.open_storage("sqlite", os.path.join(workdir, "chat_history.db"))
+
+    def save_chat(index):
+        # A new chat saved whole, then one turn appended: the app's first and later saves
+        chat_id = str(uuid.uuid4())
+        chat_store.save_chat(chat_id, history, history[-1]["timestamp"])
+        chat_store.append_messages(chat_id, history[:2], len(history), history[-1]["timestamp"])
+
+    answer = history[1]["content"]
+
+    def downloads(index):
+        exports.response_downloads(f"{index} {answer}")
+        exports.chat_export(history, "benchmark")
+
+    def turn(index):
+        # Everything a turn does outside Streamlit: answer, speech, save, downloads
+        text = generate(index)
+        synthesizer.synthesize(text[:args.tts_chars])
+        chat_store.append_messages(
+            turn_chat_id, [{"role": "user", "content": f"Question {index}"}, {"role": "assistant", "content": text}],
+            2 * (index + 2), history[-1]["timestamp"],
+        )
+        exports.response_downloads(text)
+
+    turn_chat_id = str(uuid.uuid4())
+    # The warmup run appends at seq 2, so the chat starts with one turn stored
+    chat_store.save_chat(turn_chat_id, history[:2], history[-1]["timestamp"])
+    stages += [
+        ("context_build", context_build),
+        ("generate_response", generate),
+        ("tts", synthesize),
+        ("save_chat", save_chat),
+        ("downloads", downloads),
+        ("turn", turn),
+    ]
+    cleanup = [engine.get_request_engine().close, chat_store.close]
+    return stages, cleanup
+
+
+def app_stages(args, history):
+    """(name, run(index)) for stages that drive app.py through streamlit.testing"""
+    try:
+        from streamlit.testing.v1 import AppTest
+        import google.generativeai as genai
+    except ImportError as e:
+        return [("app_render", None), ("app_turn", None)], [], f"{e.name} not installed"
+
+    real_model = genai.GenerativeModel
+    # The app builds its models through genai; answer them offline instead
+    genai.GenerativeModel = lambda model_name, **kwargs: fake_gemini.FakeGenerativeModel(
+        model_name=f"models/{model_name}", latency=args.model_latency
+    )
+
+    def new_app():
+        app = AppTest.from_file(APP_PATH, default_timeout=120)
+        app.secrets["GEMINI_API_KEY"] = "fake"
+        app.secrets["TTS_ENGINE"] = "local"
+        app.secrets["GEMINI_RPM"] = 600000
+        return app
+
+    render_app = new_app()
+    render_app.session_state["messages"] = [dict(message) for message in history]
+    render_app.run()
+
+    def render(index):
+        render_app.run()
+        if render_app.exception:
+            raise RuntimeError(render_app.exception[0].value)
+
+    turn_app = new_app()
+    turn_app.run()
+
+    def app_turn(index):
+        turn_app.chat_input[0].set_value(f"Question {index}: summarize the plan").run()
+        if turn_app.exception:
+            raise RuntimeError(turn_app.exception[0].value)
+        if not turn_app.session_state["messages"][-1]["content"].startswith("[fake:"):
+            raise RuntimeError(f"unexpected answer: {turn_app.session_state['messages'][-1]['content'][:200]}")
+
+    def restore():
+        genai.GenerativeModel = real_model
+
+    return [("app_render", render), ("app_turn", app_turn)], [restore], None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=REPO_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Rows of (stage, p50 change, peak memory change, regressed) for stages in both runs"""
+    rows = []
+    for stage, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not current.get("p50_ms") or not previous or not previous.get("p50_ms"):
+            continue
+        latency_change = current["p50_ms"] / previous["p50_ms"] - 1
+        memory_change = (current["peak_memory_kb"] / previous["peak_memory_kb"] - 1
+                         if previous.get("peak_memory_kb") else 0.0)
+        rows.append((stage, latency_change, memory_change, latency_change > threshold or memory_change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="timed runs per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf-pages", type=int, default=30)
+    parser.add_argument("--docx-paragraphs", type=int, default=300)
+    parser.add_argument("--csv-rows", type=int, default=20000)
+    parser.add_argument("--json-records", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=200, help="messages in the synthetic chat history")
+    parser.add_argument("--context-length", type=int, default=10, help="history messages sent with each prompt")
+    parser.add_argument("--context-tokens", type=int, default=chat_engine.DEFAULT_CONTEXT_TOKENS)
+    parser.add_argument("--tts-chars", type=int, default=200, help="characters of each answer read out")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="seconds per fake model call")
+    parser.add_argument("--stages", help="comma-separated stages to run (default: all)")
+    parser.add_argument("--no-app", action="store_true", help="skip the stages that drive app.py")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to this file")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against results from an earlier run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative p50/peak memory growth reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args()
+
+    sizes = {"pdf": args.pdf_pages, "docx": args.docx_paragraphs, "csv": args.csv_rows, "json": args.json_records}
+    files = {extension: generate(sizes[extension], seed=args.seed)
+             for extension, generate in corpus.FILE_GENERATORS.items()}
+    history = corpus.make_history(args.history, seed=args.seed)
+    selected = set(args.stages.split(",")) if args.stages else None
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("json", "baseline", "fail_on_regression")},
+        "input_bytes": {extension: len(file_bytes) for extension, file_bytes in files.items()},
+        "stages": {},
+    }
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="gemini-bench-") as workdir:
+        # The app and storage write their databases and caches to the working directory
+        os.chdir(workdir)
+        cleanup = []
+        try:
+            stages, cleanup = core_stages(args, files, history, workdir)
+            if not args.no_app and (not selected or selected & {"app_render", "app_turn"}):
+                more, app_cleanup, reason = app_stages(args, history)
+                cleanup += app_cleanup
+                for name, run in more:
+                    if run is None:
+                        results["stages"][name] = {"skipped": reason}
+                    else:
+                        stages.append((name, run))
+
+            for name, run in stages:
+                if selected and name not in selected:
+                    continue
+                print(f"{name}...", end=" ", file=sys.stderr, flush=True)
+                try:
+                    results["stages"][name] = measure(run, args.runs)
+                    print("done", file=sys.stderr)
+                except StageSkipped as e:
+                    results["stages"][name] = {"skipped": str(e)}
+                    print(f"skipped ({e})", file=sys.stderr)
+        finally:
+            for close in cleanup:
+                with contextlib.suppress(Exception):
+                    close()
+            os.chdir(original_dir)
+
+    print(f"{'stage':<18} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>10}")
+    for name, row in results["stages"].items():
+        if "skipped" in row:
+            print(f"{name:<18} skipped: {row['skipped']}")
+            continue
+        print(f"{name:<18} {row['throughput_per_second']:>9.1f} {row['p50_ms']:>9.2f} "
+              f"{row['p99_ms']:>9.2f} {row['peak_memory_kb']:>10.1f}")
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.baseline} (commit {baseline.get('commit') or 'unknown'}):")
+        for stage, latency_change, memory_change, is_regression in compare(results, baseline, args.threshold):
+            flag = "  REGRESSION" if is_regression else ""
+            print(f"{stage:<18} p50 {latency_change:+7.1%}   peak memory {memory_change:+7.1%}{flag}")
+            regressed = regressed or is_regression
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Content-addressed store for the binary payloads of a chat (audio, images).
+
+Session state only keeps a small reference, {"blob", "mime_type", "size"},
+and the bytes live on disk under their SHA-256, so identical payloads are
+stored once no matter how many sessions or messages use them, and a long
+chat costs a session a few hundred bytes per message instead of its audio
+and images. References are resolved when a message is rendered or an image
+is sent to the model. The directory is a disk_lru.DiskLRU capped at
+max_bytes, and a small
+in-memory LRU keeps the payloads of the messages on screen from being
+re-read on every rerun.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from disk_lru import DiskLRU
+
+DEFAULT_BLOB_DIR = ".blob_store"
+
+
+def is_blob_ref(value):
+    return isinstance(value, dict) and "blob" in value
+
+
+class BlobStore:
+    def __init__(self, directory=DEFAULT_BLOB_DIR, max_bytes=512 * 1024 * 1024, memory_bytes=16 * 1024 * 1024):
+        self.files = DiskLRU(directory, max_bytes)
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._memory = OrderedDict()
+        self._memory_total = 0
+        self._lock = threading.Lock()
+
+    def put(self, data, mime_type="application/octet-stream"):
+        """Store data (if not already stored) and return its reference"""
+        digest = hashlib.sha256(data).hexdigest()
+        ref = {"blob": digest, "mime_type": mime_type, "size": len(data)}
+        if self.files.touch(digest):
+            # Already stored, and now marked as recently used
+            with self._lock:
+                self.deduplicated += 1
+            return ref
+        evicted = self.files.write(digest, data)
+        if evicted is None:
+            # Too big to keep on disk, or the write failed; hold it in the reference itself
+            ref["data"] = data
+            return ref
+        if evicted:
+            with self._lock:
+                for name in evicted:
+                    self._forget(name)
+        return ref
+
+    def get(self, ref):
+        """The bytes behind ref, or None if it has been evicted"""
+        if "data" in ref:
+            return ref["data"]
+        digest = ref["blob"]
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                self.hits += 1
+                return data
+
+        data = self.files.read(digest)
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._remember(digest, data)
+        return data
+
+    def _remember(self, digest, data):
+        if len(data) > self.memory_bytes // 4:
+            return
+        self._memory[digest] = data
+        self._memory_total += len(data)
+        while self._memory_total > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_total -= len(evicted)
+
+    def resolve_image(self, part):
+        """Model input part for an image: references are loaded, anything else passes through.
+
+        Returns None if the referenced image has been evicted.
+        """
+        if not is_blob_ref(part):
+            return part
+        data = self.get(part)
+        return {"mime_type": part["mime_type"], "data": data} if data is not None else None
+
+    def _forget(self, digest):
+        data = self._memory.pop(digest, None)
+        if data is not None:
+            self._memory_total -= len(data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "size_bytes": self.files.total_bytes,
+                "max_bytes": self.max_bytes,
+                "memory_bytes": self._memory_total,
+            }
@@ -0,0 +1,318 @@
+"""The model-facing half of a chat turn, without Streamlit.
+
+ChatEngine turns a prompt, uploaded file contents and recent history into one
+model request, routed by request_router to image generation or a
+token-budgeted multimodal input, sent through a RequestEngine, optionally
+answered from a ResponseCache, with large uploads optionally sent once as a
+server-side cached context. app.py's GeminiChat builds on it for the UI;
+batch_runner.py uses it headless, so batch jobs get exactly the same
+prompting as the chat.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+import context_builder
+import extractors
+import request_router
+import response_cache
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTEXT_TOKENS = 8000
+RESPONSE_TOKEN_RESERVE = 8192  # kept free of the model's input window for the answer
+RETRIEVAL_TOP_K = 8  # document chunks retrieved per prompt
+
+RESPONSE_STYLES = ['Professional', 'Creative', 'Technical', 'Casual', 'Academic']
+
+
+def style_prompt(prompt, style="Professional", brief=False):
+    """Prefix a prompt with the response style (and brevity) instructions the chat uses"""
+    styled_prompt = f"[{style} style] {prompt}"
+    if brief:
+        styled_prompt = f"[Brief response] {styled_prompt}"
+    return styled_prompt
+
+
+def image_digest(image):
+    """Stable content digest of an image part in the model input"""
+    if isinstance(image, dict):
+        return hashlib.sha256(image["data"]).hexdigest()
+    return hashlib.sha256(image.tobytes()).hexdigest()
+
+
+def input_size(model_input):
+    """Approximate bytes a model input puts on the wire (text as UTF-8, images as encoded)"""
+    size = 0
+    for part in model_input:
+        if isinstance(part, str):
+            size += len(part.encode('utf-8'))
+        elif isinstance(part, dict):
+            size += len(part.get("data", b""))
+    return size
+
+
+def response_image(response):
+    """(bytes, mime type) of the first image part of a model response, or None"""
+    for part in getattr(response, "parts", None) or []:
+        inline_data = getattr(part, "inline_data", None)
+        if inline_data is not None and getattr(inline_data, "mime_type", "").startswith("image/"):
+            return inline_data.data, inline_data.mime_type
+    return None
+
+
+def load_extracted_content(extracted):
+    """Turn an extractor ("text"/"image", payload) result into what the model input expects"""
+    kind, payload = extracted
+    if kind == "image":
+        return extractors.image_blob(payload)
+    return payload
+
+
+class ChatEngine:
+    """Builds and sends the model request for one turn.
+
+    request_engine is a request_engine.RequestEngine (or anything with its
+    generate and count_tokens signatures); response_cache and retrieval_store
+    are optional and only needed for use_cache and retrieval_keys, and
+    context_cache (a context_cache.ContextCache) for use_context_cache.
+    Subclasses can supply them lazily by overriding the get_* methods. Stage timings go to metrics, a
+    metrics.MetricsRegistry (a private one if not given), along with the
+    cost of each routed mode as a "turn_<mode>" stage.
+    """
+
+    def __init__(self, text_model=None, image_model=None, api_key="", request_engine=None,
+                 response_cache=None, retrieval_store=None, metrics=None, context_cache=None):
+        self.api_key = api_key
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.text_model = text_model
+        self.image_model = image_model
+        self._request_engine = request_engine
+        self._response_cache = response_cache
+        self._retrieval_store = retrieval_store
+        self._context_cache = context_cache
+        self._input_token_limit = None
+        self.router = request_router.RequestRouter()
+        if text_model is not None:
+            # Each distinct message/file is counted only once, through the engine's rate limits and retries
+            self.token_counter = context_builder.TokenCounter(
+                lambda text: self.get_request_engine().count_tokens(self.text_model, text, api_key=self.api_key)
+            )
+        # One engine can serve many sessions or batch workers, so per-request state is kept per thread
+        self._local = threading.local()
+
+    def get_request_engine(self):
+        return self._request_engine
+
+    def get_response_cache(self):
+        return self._response_cache
+
+    def get_retrieval_store(self):
+        return self._retrieval_store
+
+    def get_context_cache(self):
+        return self._context_cache
+
+    def report_error(self, message):
+        """Surface a recoverable problem; the UI overrides this to show it"""
+        logger.warning(message)
+
+    @property
+    def last_context_stats(self):
+        """What build_model_input packed for this thread's most recent request"""
+        return getattr(self._local, "last_context_stats", None)
+
+    @property
+    def last_route(self):
+        """How this thread's most recent request was routed: mode, reason, model calls, seconds, tokens"""
+        return getattr(self._local, "last_route", None)
+
+    def call_model(self, model, contents, stream=False, request_key=None):
+        """generate_content through the shared request engine (rate limits, retries, coalescing)"""
+        self._local.model_calls = getattr(self._local, "model_calls", 0) + 1
+        return self.get_request_engine().generate(
+            model, contents, stream=stream, api_key=self.api_key, coalesce_key=request_key
+        )
+
+    def input_token_limit(self):
+        """The text model's input window, looked up once (None if unavailable)"""
+        if self._input_token_limit is None:
+            self._input_token_limit = self.lookup_input_token_limit() or 0
+        return self._input_token_limit or None
+
+    def lookup_input_token_limit(self):
+        limit = getattr(self.text_model, "input_token_limit", None)
+        if limit is not None:
+            return limit
+        try:
+            import google.generativeai as genai
+
+            return genai.get_model(self.text_model.model_name).input_token_limit
+        except Exception:
+            return 0
+
+    def cached_file_context(self, files):
+        """The uploaded files as a server-side cached context: (key, bound model, tokens) or None.
+
+        None means the files are too small to be worth caching (or caching
+        failed) and should be packed into the request as usual.
+        """
+        cache = self.get_context_cache()
+        if cache is None:
+            return None
+        parts = context_builder.file_context_parts(files)
+        tokens = context_builder.file_context_tokens(parts, self.token_counter)
+        with self.metrics.timer("context_cache") as sample:
+            sample["tokens"] = tokens
+            return cache.lookup(self.text_model, parts, tokens, image_digest)
+
+    def generate_response(self, prompt, files=None, context=None, stream=False, context_tokens=DEFAULT_CONTEXT_TOKENS,
+                          retrieval_keys=None, use_cache=False, use_context_cache=False,
+                          mode=request_router.MODE_AUTO, full_files=None):
+        """Route the prompt and generate its response (see _generate_response), recording timing and cost.
+
+        mode is one of request_router.MODES; "auto" lets the router decide.
+        """
+        self._local.last_context_stats = None
+        self._local.model_calls = 0
+        start = time.perf_counter()
+        decision = self.router.route(prompt, files, mode, image_available=self.image_model is not None)
+        response, response_type = self._generate_response(
+            prompt, files, context, stream, context_tokens, retrieval_keys, use_cache, use_context_cache, decision,
+            full_files
+        )
+        seconds = time.perf_counter() - start
+        tokens = (self.last_context_stats or {}).get("total_tokens")
+        error = response_type == "error"
+        self.metrics.observe("generate_response", seconds, tokens=tokens, error=error)
+        self.metrics.observe(f"turn_{decision.mode}", seconds, tokens=tokens, error=error)
+        self._local.last_route = dict(
+            decision.as_dict(), model_calls=self._local.model_calls, seconds=round(seconds, 3), tokens=tokens
+        )
+        return response, response_type
+
+    def generate_image(self, prompt):
+        """One image model call for the prompt; a failure is returned as the turn's error"""
+        full_prompt = request_router.strip_style_prefixes(prompt)
+
+        # Handle negative prompts included in the chat input.
+        # e.g., "A beautiful landscape --no buildings, cars"
+        prompt_parts = full_prompt.split('--no', 1)
+        positive_prompt = prompt_parts[0].strip()
+
+        # Create the contents list, which is a more robust method.
+        generation_contents = [positive_prompt]
+
+        if len(prompt_parts) > 1 and prompt_parts[1].strip():
+            negative_prompt = prompt_parts[1].strip()
+            # Add the negative prompt in the format the API expects.
+            generation_contents.append(f"Negative prompt: {negative_prompt}")
+
+        try:
+            with self.metrics.timer("image_model_call"):
+                response = self.call_model(self.image_model, generation_contents)
+        except Exception as e:
+            # No text-only retry: a turn costs at most one model call
+            return f"Error: Image generation failed: {e}", "error"
+
+        # A model that answers in words instead is shown as a text response
+        return response, "image" if response_image(response) else "text"
+
+    def _generate_response(self, prompt, files=None, context=None, stream=False, context_tokens=DEFAULT_CONTEXT_TOKENS,
+                           retrieval_keys=None, use_cache=False, use_context_cache=False, decision=None,
+                           full_files=None):
+        """Generate response using Gemini API for image generation OR for analyzing text, files, and uploaded images.
+
+        decision (a request_router.RouteDecision) picks image generation, plain
+        text (files are left out) or file analysis; each makes at most one
+        model call.
+
+        With stream=True text responses are returned unresolved so the caller can
+        iterate the chunks as they arrive (see stream_response_text). History and
+        file excerpts are packed into context_tokens (capped by the model's window);
+        with retrieval_keys, file excerpts are the top-k indexed chunks instead.
+        With use_cache, an identical earlier request (same model input and model)
+        is answered from the local response cache; such responses have
+        from_cache set. With use_context_cache, files large enough to cache are
+        sent whole once as a server-side cached context and later turns only
+        send the history and prompt (not combined with retrieval, whose
+        excerpts change every turn). full_files, if given, are the same uploads
+        as whole documents: they are what gets cached, while files (excerpts)
+        are still what is sent inline if the cache declines them."""
+        try:
+            if decision is None:
+                decision = self.router.route(prompt, files, image_available=self.image_model is not None)
+            # Creating an image is separate from analyzing uploaded files
+            if decision.mode == request_router.MODE_IMAGE:
+                return self.generate_image(prompt)
+            if decision.mode == request_router.MODE_TEXT:
+                files = retrieval_keys = None
+
+            # This is the flow for analyzing inputs (text, uploaded files, and uploaded images).
+            # Context and file excerpts are packed by token budget, prompt last.
+            budget = context_tokens
+            model = self.text_model
+            cached_context = None
+            if use_context_cache and files and not retrieval_keys:
+                cached_context = self.cached_file_context(full_files or files)
+            reserved = RESPONSE_TOKEN_RESERVE
+            if cached_context:
+                cache_key, model, cached_tokens = cached_context
+                files = None
+                reserved += cached_tokens
+            input_limit = self.input_token_limit()
+            if input_limit:
+                budget = min(budget, input_limit - reserved)
+            retrieved_chunks = None
+            if retrieval_keys:
+                # Search on the request itself, without the [style] prefixes
+                query = request_router.strip_style_prefixes(prompt)
+                with self.metrics.timer("retrieval"):
+                    retrieved_chunks = self.get_retrieval_store().search(retrieval_keys, query, k=RETRIEVAL_TOP_K)
+            with self.metrics.timer("context_build") as sample:
+                model_input, self._local.last_context_stats = context_builder.build_model_input(
+                    prompt, files, context, self.token_counter, budget, retrieved_chunks
+                )
+                sample["tokens"] = self.last_context_stats["total_tokens"]
+            if cached_context:
+                self.last_context_stats["cached_context_tokens"] = cached_tokens
+
+            # Identical requests share one key for the response cache and in-flight coalescing
+            model_name = self.text_model.model_name
+            key_input = [f"cached-context:{cache_key}"] + model_input if cached_context else model_input
+            request_key = response_cache.make_request_key(model_name, key_input, image_digest)
+            if use_cache:
+                cache = self.get_response_cache()
+                cached_text = cache.get(request_key)
+                if cached_text is not None:
+                    return response_cache.CachedResponse(cached_text), "text"
+
+            # Generate a response from the combined multimodal input; a stream
+            # returns here once the first chunk is available
+            with self.metrics.timer("model_call") as sample:
+                sample["bytes"] = input_size(model_input)
+                try:
+                    response = self.call_model(model, model_input, stream=stream, request_key=request_key)
+                except Exception:
+                    if cached_context:
+                        # Most likely expired or dropped server-side; the next turn creates it again
+                        self.get_context_cache().invalidate(cache_key)
+                    raise
+
+            if use_cache:
+                if stream:
+                    response = response_cache.CachingStream(
+                        response, lambda text: cache.put(request_key, model_name, text)
+                    )
+                else:
+                    try:
+                        cache.put(request_key, model_name, response.text)
+                    except Exception:
+                        # Blocked/empty responses have no text; they just aren't cached
+                        pass
+            return response, "text"
+
+        except Exception as e:
+            return f"Error: {str(e)}", "error"
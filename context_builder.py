@@ -0,0 +1,247 @@
+"""Token-budgeted assembly of the model input for GeminiChat.generate_response.
+
+History and file excerpts are packed by token count instead of fixed
+character slices: file chunks most relevant to the prompt first, then the
+most recent conversation turns in whatever budget is left.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Gemini bills each image part at a flat rate
+IMAGE_TOKENS = 258
+
+# Share of the budget file excerpts may take before history gets the rest
+FILE_BUDGET_SHARE = 0.6
+
+CHUNK_CHARS = 1500
+
+# Below this many tokens of headroom a truncated message isn't worth including
+MIN_PARTIAL_TOKENS = 50
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for when the model can't be asked"""
+    return max(1, len(text) // 4)
+
+
+class TokenCounter:
+    """Memoized token counting, so each distinct text is counted only once.
+
+    count_fn is the model's counter (e.g. RequestEngine.count_tokens); when it
+    is missing or fails the count falls back to estimate_tokens. Estimates
+    aren't memoized, so the text is counted for real once count_fn recovers,
+    but after a failure count_fn is left alone for retry_after seconds.
+    """
+
+    def __init__(self, count_fn=None, max_entries=4096, retry_after=60.0):
+        self.count_fn = count_fn
+        self.max_entries = max_entries
+        self.retry_after = retry_after
+        self._failed_at = None
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text):
+        if not text:
+            return 0
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+            backing_off = self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_after
+
+        if self.count_fn is None or backing_off:
+            return estimate_tokens(text)
+        try:
+            tokens = int(self.count_fn(text))
+        except Exception:
+            with self._lock:
+                self._failed_at = time.monotonic()
+            return estimate_tokens(text)
+
+        with self._lock:
+            self._failed_at = None
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def chars_per_token(self, text):
+        return len(text) / max(1, self.count(text))
+
+
+def split_into_chunks(text, chunk_chars=CHUNK_CHARS):
+    """Split text into roughly chunk_chars pieces, preferring paragraph boundaries"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r'\n\s*\n', text):
+        while len(paragraph) > chunk_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:chunk_chars])
+            paragraph = paragraph[chunk_chars:]
+        if current and len(current) + len(paragraph) + 2 > chunk_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def query_terms(prompt):
+    return {term for term in re.findall(r'\w+', prompt.lower()) if len(term) > 2}
+
+
+def score_chunk(chunk, terms):
+    """Relevance of a chunk to the prompt: how many distinct prompt terms it contains"""
+    chunk_terms = set(re.findall(r'\w+', chunk.lower()))
+    return len(terms & chunk_terms)
+
+
+def rank_file_chunks(prompt, file_texts, counter):
+    """Lexically rank every chunk of file_texts against prompt.
+
+    Returns candidates (score, file_index, position, chunk, tokens). Chunk
+    sizes are estimated from each file's own characters-per-token ratio, so
+    only whole files are sent to the counter.
+    """
+    terms = query_terms(prompt)
+    candidates = []
+    for file_index, text in enumerate(file_texts):
+        if not text:
+            continue
+        ratio = counter.chars_per_token(text)
+        for position, chunk in enumerate(split_into_chunks(text)):
+            tokens = max(1, int(len(chunk) / ratio))
+            candidates.append((score_chunk(chunk, terms), file_index, position, chunk, tokens))
+    return candidates
+
+
+def select_file_chunks(candidates, budget):
+    """Pack the best-scoring candidate chunks that fit in budget tokens.
+
+    Returns {file_index: [chunk, ...]} with each file's chunks in document
+    order, and the tokens used.
+    """
+    # Best match first; ties keep document order, so with no matches files are read from the top
+    candidates = sorted(candidates, key=lambda c: (-c[0], c[1], c[2]))
+
+    selected = {}
+    used = 0
+    for _, file_index, position, chunk, tokens in candidates:
+        if used + tokens > budget:
+            continue
+        selected.setdefault(file_index, []).append((position, chunk))
+        used += tokens
+
+    return {
+        file_index: [chunk for _, chunk in sorted(chunks)]
+        for file_index, chunks in selected.items()
+    }, used
+
+
+def select_history(context, counter, budget):
+    """Most recent messages that fit in budget tokens, returned oldest first.
+
+    The newest message that doesn't fit whole is truncated to the remaining
+    budget rather than dropped, if there is a useful amount left.
+    """
+    lines = []
+    used = 0
+    for msg in reversed(context):
+        line = f"{msg['role']}: {msg['content']}"
+        tokens = counter.count(line)
+        if used + tokens <= budget:
+            lines.append(line)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= MIN_PARTIAL_TOKENS:
+            keep_chars = int(remaining * counter.chars_per_token(line))
+            lines.append(line[:keep_chars] + "...")
+            used = budget
+        break
+    return list(reversed(lines)), used
+
+
+def file_context_parts(files):
+    """The uploaded files whole, as one stable prefix for a server-side cached context"""
+    parts = ["Please analyze the following uploaded file(s) to answer the user's request:"]
+    for file_content in files:
+        if isinstance(file_content, str):
+            parts.append(f"--- File Content ---\n{file_content}")
+        else:
+            parts.append(file_content)
+    return parts
+
+
+def file_context_tokens(parts, counter):
+    return sum(counter.count(part) if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+
+
+def build_model_input(prompt, files, context, counter, budget, retrieved_chunks=None):
+    """Assemble the multimodal model input within budget tokens.
+
+    files holds extracted text (str) or image parts; context is the recent
+    message history. retrieved_chunks, if given, replaces the lexical ranking
+    of the text files with (score, document_number, position, chunk) results
+    from a retrieval index. Returns (model_input, stats) where stats records
+    what was included and the tokens each section used.
+    """
+    text_files = []
+    images = []
+    for file_content in files or []:
+        if isinstance(file_content, str):
+            text_files.append(file_content)
+        else:
+            images.append(file_content)
+
+    prompt_part = f"\n--- User's Request ---\n{prompt}"
+    remaining = budget - estimate_tokens(prompt_part) - IMAGE_TOKENS * len(images)
+
+    if retrieved_chunks is not None:
+        candidates = [
+            (score, document_number, position, chunk, estimate_tokens(chunk))
+            for score, document_number, position, chunk in retrieved_chunks
+        ]
+    else:
+        candidates = rank_file_chunks(prompt, text_files, counter)
+    file_chunks, file_tokens = select_file_chunks(
+        candidates, max(0, int(remaining * FILE_BUDGET_SHARE))
+    )
+    remaining -= file_tokens
+
+    history_lines, history_tokens = select_history(context or [], counter, max(0, remaining))
+
+    model_input = []
+    if history_lines:
+        context_text = "\n".join(history_lines)
+        model_input.append(f"Context from conversation:\n{context_text}\n---")
+
+    if file_chunks or images:
+        model_input.append("Please analyze the following uploaded file(s) to answer the user's request:")
+        for file_index in sorted(file_chunks):
+            excerpt = "\n...\n".join(file_chunks[file_index])
+            model_input.append(f"--- File Content ---\n{excerpt}")
+        # Add the image parts directly to the input
+        model_input.extend(images)
+
+    model_input.append(prompt_part)
+
+    stats = {
+        "budget": budget,
+        "history_messages": len(history_lines),
+        "history_tokens": history_tokens,
+        "file_chunks": sum(len(chunks) for chunks in file_chunks.values()),
+        "retrieval": retrieved_chunks is not None,
+        "file_tokens": file_tokens,
+        "images": len(images),
+        "total_tokens": budget - remaining + history_tokens,
+    }
+    return model_input, stats
@@ -0,0 +1,176 @@
+"""Server-side caching of large uploaded files, so each turn doesn't resend them.
+
+Without it every turn of a conversation about one big document puts the
+whole document back in the request. ContextCache registers the uploaded
+files' content once as a cached context on the model's side, keyed by a
+hash of the model and the file contents, and later turns send only the
+history and the prompt against that prefix. Entries carry a TTL: one close
+to expiry is refreshed on use instead of recreated, and one that can't be
+refreshed (expired or dropped server-side) is created again.
+
+The backend does the server calls: GeminiCacheBackend uses the Gemini
+caching API, and fake_gemini.FakeCacheBackend stands in offline. Content
+below min_tokens is not worth a cache (and the API rejects it), so it is
+left to be sent inline as before.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 3600
+# Refresh an entry used within this long of its expiry
+REFRESH_MARGIN_SECONDS = 300
+# Smallest cached context the API accepts
+DEFAULT_MIN_TOKENS = 4096
+# How long to wait before retrying content the backend refused to cache
+FAILURE_RETRY_SECONDS = 600
+
+
+class GeminiCacheBackend:
+    """Cached contents through google.generativeai.caching"""
+
+    def create(self, model, contents, ttl_seconds):
+        # Imported on first use, like the rest of the optional model features
+        import datetime
+
+        from google.generativeai import caching
+
+        return caching.CachedContent.create(
+            model=model.model_name, contents=contents,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+
+    def refresh(self, handle, ttl_seconds):
+        import datetime
+
+        handle.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def bind(self, model, handle):
+        """A model whose requests are answered on top of the cached contents"""
+        import google.generativeai as genai
+
+        return genai.GenerativeModel.from_cached_content(cached_content=handle)
+
+    def delete(self, handle):
+        handle.delete()
+
+
+class CacheEntry:
+    def __init__(self, handle, tokens, expires_at):
+        self.handle = handle
+        self.tokens = tokens
+        self.expires_at = expires_at
+        # Set for content the backend refused; no handle, retried after expires_at
+        self.failed = handle is None
+
+
+def content_key(model_name, parts, image_digest):
+    """Hash of the model and the cached parts (text, or images via image_digest)"""
+    digest = hashlib.sha256(model_name.encode('utf-8'))
+    for part in parts:
+        if isinstance(part, str):
+            digest.update(b"\0text\0" + part.encode('utf-8'))
+        else:
+            digest.update(b"\0image\0" + image_digest(part).encode('ascii'))
+    return digest.hexdigest()
+
+
+class ContextCache:
+    """Process-wide registry of cached contexts, keyed by content hash.
+
+    At most max_entries are tracked; the least recently used is deleted on
+    the backend when a new one would exceed that.
+    """
+
+    def __init__(self, backend=None, ttl_seconds=DEFAULT_TTL_SECONDS, refresh_margin=REFRESH_MARGIN_SECONDS,
+                 min_tokens=DEFAULT_MIN_TOKENS, max_entries=64):
+        self.backend = backend or GeminiCacheBackend()
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.stats = {"created": 0, "refreshed": 0, "hits": 0, "failures": 0, "skipped": 0}
+        self._entries = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, model, parts, tokens, image_digest):
+        """The cached context for parts, creating or refreshing it as needed.
+
+        tokens is what the parts cost inline. Returns (key, model bound to the
+        cached context, tokens) or None if the parts should be sent inline.
+        """
+        if tokens < self.min_tokens:
+            self.stats["skipped"] += 1
+            return None
+        key = content_key(model.model_name, parts, image_digest)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Sessions sharing a document wait for one creation instead of racing
+        with key_lock:
+            entry = self._current_entry(key, model, parts, tokens)
+        if entry is None or entry.failed:
+            return None
+        return key, self.backend.bind(model, entry.handle), entry.tokens
+
+    def _current_entry(self, key, model, parts, tokens):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry.failed:
+            if now < entry.expires_at:
+                return entry
+            entry = None
+
+        if entry is not None and now < entry.expires_at - self.refresh_margin:
+            self.stats["hits"] += 1
+            return entry
+        if entry is not None and now < entry.expires_at:
+            try:
+                self.backend.refresh(entry.handle, self.ttl_seconds)
+                entry.expires_at = now + self.ttl_seconds
+                self.stats["refreshed"] += 1
+                return entry
+            except Exception as e:
+                # Gone on the server already; create it again below
+                logger.info("Refreshing cached context %s failed: %s", key[:12], e)
+
+        try:
+            handle = self.backend.create(model, parts, self.ttl_seconds)
+            entry = CacheEntry(handle, tokens, now + self.ttl_seconds)
+            self.stats["created"] += 1
+        except Exception as e:
+            # e.g. a model without caching support; send inline and try again later
+            logger.warning("Caching context for %s failed: %s", model.model_name, e)
+            entry = CacheEntry(None, tokens, now + FAILURE_RETRY_SECONDS)
+            self.stats["failures"] += 1
+        self._store(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                old_key, old = self._entries.popitem(last=False)
+                self._key_locks.pop(old_key, None)
+                evicted.append(old)
+        for old in evicted:
+            if not old.failed:
+                try:
+                    self.backend.delete(old.handle)
+                except Exception:
+                    # It expires on its own anyway
+                    pass
+
+    def invalidate(self, key):
+        """Forget an entry the server no longer has, so the next lookup recreates it"""
+        with self._lock:
+            self._entries.pop(key, None)
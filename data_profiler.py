@@ -0,0 +1,517 @@
+"""Bounded-memory profiling of tabular data files (CSV, JSON, XLSX).
+
+Instead of loading a whole data file into a DataFrame, rows are read in
+chunks and folded into per-column accumulators (type, nulls, numeric
+statistics, top values) plus a reservoir sample of rows, so a multi-gigabyte
+CSV costs one chunk of memory. The result is a compact text summary for the
+prompt: schema, types, statistics and a few representative rows.
+
+JSON is decoded one value at a time (array items, object members or JSON
+Lines records) from a sliding window over the upload's bytes, rather than
+turning the whole document into one string and then Python objects.
+
+Like extractors, this module has no Streamlit imports so it can run in the
+ingestion process pool; extractors imports it on first use.
+"""
+import codecs
+import json
+import math
+import random
+import re
+from collections import Counter
+from io import BytesIO
+
+import pandas as pd
+
+CSV_CHUNK_ROWS = 50000
+RECORD_BATCH_ROWS = 10000
+
+HEAD_ROWS = 5
+SAMPLE_ROWS = 10
+TOP_VALUES = 3
+
+# Distinct values are counted exactly up to this many per column; beyond it
+# only the most frequent TOP_TRACKED are kept, so top values become approximate
+DISTINCT_LIMIT = 10000
+TOP_TRACKED = 1000
+
+# Nested JSON values are flattened to (truncated) JSON text
+MAX_CELL_CHARS = 200
+# Members of a top-level JSON object listed individually before summarizing the rest
+MAX_OBJECT_KEYS = 50
+# Arrays inside a top-level JSON object that get a full table profile
+MAX_OBJECT_TABLES = 5
+# A first line shorter than this is probed for JSON Lines
+JSONL_PROBE_CHARS = 1024 * 1024
+# Characters of a JSON upload decoded at a time
+JSON_CHUNK_CHARS = 256 * 1024
+
+# pandas.api.types.infer_dtype result -> the type name shown in the summary
+INFERRED_KINDS = {
+    "integer": "integer",
+    "floating": "float",
+    "mixed-integer-float": "float",
+    "decimal": "float",
+    "boolean": "boolean",
+    "datetime64": "datetime",
+    "datetime": "datetime",
+    "date": "datetime",
+    "string": "text",
+    "mixed": "mixed",
+    "mixed-integer": "mixed",
+}
+
+
+def format_number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:,.1f}" if abs(value) >= 1000 else f"{value:.4g}"
+    return f"{int(value):,}"
+
+
+def format_value(value, limit=40):
+    text = str(value)
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return f'"{text}"' if isinstance(value, str) else text
+
+
+class ColumnProfile:
+    """Running statistics for one column, updated a chunk at a time"""
+
+    def __init__(self, name):
+        self.name = name
+        self.nulls = 0
+        self.kinds = set()
+        # Numeric columns: count, mean and sum of squared deviations (merged per chunk)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.min_length = None
+        self.max_length = None
+        self.values = Counter()
+        self.distinct_capped = False
+
+    @property
+    def kind(self):
+        if not self.kinds:
+            return "empty"
+        if self.kinds <= {"integer", "float"}:
+            return "float" if "float" in self.kinds else "integer"
+        if len(self.kinds) == 1:
+            return next(iter(self.kinds))
+        return "mixed"
+
+    def update(self, series):
+        non_null = series.dropna()
+        self.nulls += len(series) - len(non_null)
+        if non_null.empty:
+            return
+
+        inferred = pd.api.types.infer_dtype(non_null, skipna=True)
+        kind = INFERRED_KINDS.get(inferred, inferred)
+        self.kinds.add(kind)
+
+        if kind in ("integer", "float"):
+            self._update_numeric(pd.to_numeric(non_null, errors='coerce').dropna().astype(float))
+        elif kind == "datetime" and pd.api.types.is_datetime64_any_dtype(non_null):
+            low, high = non_null.min(), non_null.max()
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+        elif kind == "text":
+            lengths = non_null.str.len()
+            low, high = int(lengths.min()), int(lengths.max())
+            self.min_length = low if self.min_length is None else min(self.min_length, low)
+            self.max_length = high if self.max_length is None else max(self.max_length, high)
+
+        self._update_values(non_null.value_counts())
+
+    def _update_numeric(self, values):
+        if values.empty:
+            return
+        # Chan et al.'s pairwise update, so mean and variance stay exact across chunks
+        count = len(values)
+        mean = float(values.mean())
+        m2 = float(((values - mean) ** 2).sum())
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        low, high = float(values.min()), float(values.max())
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def _update_values(self, counts):
+        if self.distinct_capped:
+            counts = counts.head(TOP_TRACKED)
+        self.values.update(counts.to_dict())
+        if len(self.values) > DISTINCT_LIMIT:
+            self.distinct_capped = True
+        if self.distinct_capped and len(self.values) > 2 * TOP_TRACKED:
+            self.values = Counter(dict(self.values.most_common(TOP_TRACKED)))
+
+    def describe(self):
+        details = []
+        if self.nulls:
+            details.append(f"{self.nulls:,} null")
+        if self.distinct_capped:
+            details.append(f"{DISTINCT_LIMIT:,}+ distinct")
+        elif self.values:
+            details.append(f"{len(self.values):,} distinct")
+
+        kind = self.kind
+        if kind in ("integer", "float") and self.count:
+            std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+            details.append(
+                f"min {format_number(self.minimum)}, max {format_number(self.maximum)}, "
+                f"mean {format_number(self.mean)}, std {format_number(std)}"
+            )
+        elif kind == "datetime" and self.minimum is not None:
+            details.append(f"from {self.minimum} to {self.maximum}")
+        elif kind == "text" and self.min_length is not None:
+            details.append(f"length {self.min_length}-{self.max_length}")
+        # Top values only say something when some value repeats
+        if kind not in ("integer", "float") and self.values and self.values.most_common(1)[0][1] > 1:
+            top = ", ".join(f"{format_value(value)} ({count:,})"
+                            for value, count in self.values.most_common(TOP_VALUES))
+            details.append(f"top{' (approx.)' if self.distinct_capped else ''}: {top}")
+
+        return f"{self.name} ({kind})" + (": " + "; ".join(details) if details else "")
+
+
+class TableProfile:
+    """Profile of a table fed in chunks: column statistics, first rows and a uniform row sample"""
+
+    def __init__(self, sample_size=SAMPLE_ROWS, head_size=HEAD_ROWS, seed=0):
+        self.sample_size = sample_size
+        self.head_size = head_size
+        self.rows = 0
+        self.columns = {}
+        self.head = []
+        # (row number, row) pairs kept by reservoir sampling (Li's Algorithm L),
+        # which draws a random skip instead of a random number per row
+        self.sample = []
+        self._random = random.Random(seed)
+        self._weight = 1.0
+        self._next_sample = 0
+
+    def add_chunk(self, df):
+        for name in self.columns:
+            if name not in df.columns:
+                self.columns[name].nulls += len(df)
+        for position, name in enumerate(df.columns):
+            column = self.columns.get(name)
+            if column is None:
+                column = self.columns[name] = ColumnProfile(name)
+                # Rows before this column first appeared didn't have it
+                column.nulls += self.rows
+            column.update(df.iloc[:, position])
+
+        while len(self.head) < self.head_size and len(self.head) < self.rows + len(df):
+            self.head.append(self._row(df, len(self.head) - self.rows))
+        self._sample_rows(df)
+        self.rows += len(df)
+
+    def add_records(self, records, batch_rows=RECORD_BATCH_ROWS):
+        """Profile an iterable of JSON values, batched into DataFrames"""
+        batch = []
+        for record in records:
+            batch.append(flatten_record(record))
+            if len(batch) >= batch_rows:
+                self.add_chunk(pd.DataFrame.from_records(batch))
+                batch = []
+        if batch:
+            self.add_chunk(pd.DataFrame.from_records(batch))
+
+    @staticmethod
+    def _row(df, position):
+        return dict(zip(df.columns, df.iloc[position].tolist()))
+
+    def _uniform(self):
+        # random() can return 0.0, whose log is undefined
+        return self._random.random() or 1e-300
+
+    def _skip(self):
+        return math.floor(math.log(self._uniform()) / math.log(1 - self._weight)) + 1
+
+    def _sample_rows(self, df):
+        end = self.rows + len(df)
+        while self._next_sample < end:
+            row_number = self._next_sample
+            row = (row_number, self._row(df, row_number - self.rows))
+            if len(self.sample) < self.sample_size:
+                self.sample.append(row)
+                self._next_sample += 1
+                if len(self.sample) == self.sample_size:
+                    self._weight = math.exp(math.log(self._uniform()) / self.sample_size)
+                    self._next_sample = row_number + self._skip()
+            else:
+                self.sample[self._random.randrange(self.sample_size)] = row
+                self._weight *= math.exp(math.log(self._uniform()) / self.sample_size)
+                self._next_sample = row_number + self._skip()
+
+    def _render_rows(self, rows, row_numbers):
+        frame = pd.DataFrame(rows, index=row_numbers, columns=list(self.columns))
+        return frame.to_string(max_colwidth=40)
+
+    def summary(self, title):
+        lines = [f"{title}: {self.rows:,} rows x {len(self.columns)} columns", "Columns:"]
+        lines.extend(f"- {column.describe()}" for column in self.columns.values())
+        if not self.rows:
+            return "\n".join(lines)
+
+        # Row numbers are 1-based, as in a spreadsheet
+        if self.rows <= self.sample_size:
+            rows = sorted(self.sample, key=lambda item: item[0])
+            lines += ["", f"All {self.rows:,} rows:",
+                      self._render_rows([row for _, row in rows], [number + 1 for number, _ in rows])]
+        else:
+            rows = sorted(self.sample, key=lambda item: item[0])
+            lines += ["", f"First {len(self.head)} rows:",
+                      self._render_rows(self.head, list(range(1, len(self.head) + 1))),
+                      "", f"Random sample of {len(rows)} rows:",
+                      self._render_rows([row for _, row in rows], [number + 1 for number, _ in rows])]
+        return "\n".join(lines)
+
+
+def flatten_record(record):
+    """One table row from a JSON value: object members become columns, nested values JSON text"""
+    if not isinstance(record, dict):
+        record = {"value": record}
+    return {
+        key: json.dumps(value, ensure_ascii=False)[:MAX_CELL_CHARS] if isinstance(value, (dict, list)) else value
+        for key, value in record.items()
+    }
+
+
+_WHITESPACE = re.compile(r'\s*')
+# Text after a decoded value that may still be part of it: a number cut off at "1." or "1e"
+_NUMBER_TAIL = re.compile(r'[-+.eE0-9]*\Z')
+_DECODER = json.JSONDecoder()
+
+
+class JsonStream:
+    """Incremental reader over JSON bytes that decodes one value at a time.
+
+    The bytes are decoded chunk_chars at a time into a sliding text buffer;
+    the part before the current value is dropped whenever more is read, so
+    memory is one chunk plus the largest single value decoded.
+    """
+
+    def __init__(self, data, chunk_chars=JSON_CHUNK_CHARS):
+        self.data = memoryview(data)
+        self.chunk_chars = chunk_chars
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+        self.read_pos = 0
+        self.text = ''
+        self.pos = 0
+        # Characters dropped from the front of text, for error offsets
+        self.offset = 0
+
+    @property
+    def exhausted(self):
+        return self.read_pos >= len(self.data)
+
+    def _fill(self, size=None):
+        """Read at least size more characters' worth of bytes; False at the end of the data"""
+        if self.exhausted:
+            return False
+        size = size or self.chunk_chars
+        chunk = self.data[self.read_pos:self.read_pos + size]
+        self.read_pos += len(chunk)
+        self.offset += self.pos
+        self.text = self.text[self.pos:] + self.decoder.decode(chunk, final=self.exhausted)
+        self.pos = 0
+        return True
+
+    def head(self, chars):
+        """The next chars characters (fewer at the end), without consuming them"""
+        while len(self.text) - self.pos < chars and self._fill():
+            pass
+        return self.text[self.pos:self.pos + chars]
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at the end)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self._fill():
+                return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.offset + self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                # Possibly cut off by the end of the buffer; read as much again and retry
+                if not self._fill(max(self.chunk_chars, len(self.text) - self.pos)):
+                    raise
+                continue
+            # A number that runs to the end of the buffer may continue in the next chunk
+            if not _NUMBER_TAIL.match(self.text, end) or not self._fill():
+                self.pos = end
+                return value
+
+    def values(self):
+        """Yield consecutive top-level values (JSON Lines)"""
+        while self.peek():
+            yield self.value()
+
+    def array_items(self):
+        """Yield the items of the array at the current position"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect(']')
+
+    def object_keys(self):
+        """Yield the keys of the object at the current position.
+
+        The caller must consume each member's value (value() or array_items())
+        before asking for the next key.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() != ',':
+                break
+            self.pos += 1
+        self.expect('}')
+
+
+def describe_json_value(value):
+    if isinstance(value, dict):
+        keys = ", ".join(list(value)[:8])
+        return f"object with {len(value):,} key{'s' if len(value) != 1 else ''} ({keys}{', …' if len(value) > 8 else ''})"
+    if isinstance(value, str):
+        return f"string {format_value(value, limit=80)}"
+    return json.dumps(value)
+
+
+def is_json_lines(text):
+    """True if the first line is a complete JSON value and more content follows it"""
+    newline = text.find('\n')
+    if newline <= 0 or newline > JSONL_PROBE_CHARS or not text[newline:].strip():
+        return False
+    try:
+        json.loads(text[:newline])
+    except ValueError:
+        return False
+    return True
+
+
+def profile_json_object(stream):
+    lines = []
+    tables = []
+    key_count = 0
+    for key in stream.object_keys():
+        key_count += 1
+        listed = key_count <= MAX_OBJECT_KEYS
+        if stream.peek() == '[':
+            if len(tables) < MAX_OBJECT_TABLES:
+                table = TableProfile()
+                table.add_records(stream.array_items())
+                tables.append((key, table))
+                items = table.rows
+            else:
+                items = sum(1 for _ in stream.array_items())
+            if listed:
+                lines.append(f"- {key}: array of {items:,} items")
+        else:
+            value = stream.value()
+            if listed:
+                lines.append(f"- {key}: {describe_json_value(value)}")
+    if key_count > MAX_OBJECT_KEYS:
+        lines.append(f"(+{key_count - MAX_OBJECT_KEYS:,} more keys)")
+
+    sections = ["\n".join([f"JSON object with {key_count:,} keys:"] + lines)]
+    sections.extend(table.summary(f'JSON array "{key}"') for key, table in tables)
+    return "\n\n".join(sections)
+
+
+def profile_json(file_bytes):
+    """Summarize a JSON or JSON Lines document without building it in memory"""
+    stream = JsonStream(file_bytes)
+    first = stream.peek()
+    if first == '[':
+        table = TableProfile()
+        table.add_records(stream.array_items())
+        return table.summary("JSON array")
+    if is_json_lines(stream.head(JSONL_PROBE_CHARS + JSON_CHUNK_CHARS)):
+        table = TableProfile()
+        table.add_records(stream.values())
+        return table.summary("JSON Lines")
+    if first == '{':
+        return profile_json_object(stream)
+    return f"JSON value: {describe_json_value(stream.value())}"
+
+
+def profile_csv(file_bytes, chunk_rows=CSV_CHUNK_ROWS):
+    """Summarize a CSV file, reading chunk_rows rows at a time"""
+    table = TableProfile()
+    with pd.read_csv(BytesIO(file_bytes), chunksize=chunk_rows, encoding_errors='replace') as reader:
+        for chunk in reader:
+            table.add_chunk(chunk)
+    return table.summary("CSV file")
+
+
+def unique_column_names(header):
+    names = []
+    seen = Counter()
+    for position, name in enumerate(header):
+        name = str(name) if name is not None else f"column_{position + 1}"
+        seen[name] += 1
+        names.append(name if seen[name] == 1 else f"{name}.{seen[name] - 1}")
+    return names
+
+
+def profile_xlsx(file_bytes, chunk_rows=RECORD_BATCH_ROWS):
+    """Summarize every sheet of an XLSX workbook; the first row of each sheet is its header"""
+    from openpyxl import load_workbook
+
+    # read_only streams the sheet XML instead of building every cell object up front
+    workbook = load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    sections = []
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                sections.append(f'Sheet "{sheet.title}": empty')
+                continue
+            columns = unique_column_names(header)
+            width = len(columns)
+            table = TableProfile()
+            batch = []
+            for row in rows:
+                if not any(cell is not None for cell in row):
+                    continue
+                # Rows can be shorter or longer than the header in read-only mode
+                batch.append((tuple(row) + (None,) * width)[:width])
+                if len(batch) >= chunk_rows:
+                    table.add_chunk(pd.DataFrame(batch, columns=columns))
+                    batch = []
+            if batch:
+                table.add_chunk(pd.DataFrame(batch, columns=columns))
+            sections.append(table.summary(f'Sheet "{sheet.title}"'))
+    finally:
+        workbook.close()
+    return "\n\n".join(sections)
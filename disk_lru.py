@@ -0,0 +1,107 @@
+"""A directory of files capped at max_bytes, evicting the least recently used.
+
+The storage half of the on-disk caches (extraction_cache, blob_store): the
+callers decide what the entries are called and what goes in them. File
+mtimes are the LRU clock, so the order survives restarts and is shared by
+every process using the directory; reads touch the file. Writes go to a
+temporary name first and are renamed into place, so readers never see a
+half-written entry.
+"""
+import os
+import threading
+import uuid
+
+TMP_SUFFIX = ".tmp"
+
+
+class DiskLRU:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(TMP_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def touch(self, name):
+        """Mark an entry as recently used; False if it isn't stored"""
+        try:
+            os.utime(self.path(name))
+            return True
+        except OSError:
+            return False
+
+    def read(self, name):
+        """The entry's bytes (marking it recently used), or None if it isn't stored"""
+        path = self.path(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def write(self, name, data):
+        """Store data under name, evicting older entries if over budget.
+
+        Returns the names evicted to make room, or None if data wasn't stored
+        (larger than max_bytes, or the write failed).
+        """
+        if len(data) > self.max_bytes:
+            return None
+        path = self.path(name)
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+        try:
+            tmp_path = f"{path}.{uuid.uuid4().hex}{TMP_SUFFIX}"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return None
+
+        with self._lock:
+            self.total_bytes += len(data) - previous_size
+            if self.total_bytes > self.max_bytes:
+                return self._evict(keep=path)
+        return []
+
+    def _evict(self, keep=None):
+        # Oldest-used first until we're back under budget; never the entry just written
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+                total -= size
+                evicted.append(os.path.basename(path))
+            except OSError:
+                pass
+        self.total_bytes = total
+        return evicted
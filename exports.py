@@ -0,0 +1,194 @@
+"""Download and export artifacts for responses and chats.
+
+No Streamlit imports, so the same code backs the app's download buttons and
+can be exercised by the benchmarks.
+
+export_chats writes every stored conversation (or a date range or a list of
+chat ids) to a ZIP archive as JSONL, Markdown and/or plain text. Chats are
+read from storage one at a time and their messages streamed straight into
+the archive, so memory stays flat however large the history is. It also
+runs from the command line:
+
+    python exports.py -o chats.zip --format jsonl --format md --start 2024-01-01 --end 2024-03-31
+"""
+import argparse
+import json
+import re
+import sys
+import zipfile
+from datetime import datetime
+
+import storage
+
+# Fast deflate: exports are mostly repetitive text, and level 1 is several
+# times quicker than the default for archives only ~20% larger
+EXPORT_COMPRESSLEVEL = 1
+# Text is handed to the compressor in pieces of about this size
+EXPORT_WRITE_BYTES = 64 * 1024
+
+# format -> (directory in the archive, file extension)
+EXPORT_FORMATS = {
+    "jsonl": ("jsonl", "jsonl"),
+    "md": ("markdown", "md"),
+    "txt": ("text", "txt"),
+}
+
+
+def response_downloads(content):
+    """txt, md and json downloads of one response, as {format: bytes}"""
+    data = {
+        "response": content,
+        "timestamp": datetime.now().isoformat()
+    }
+    return {
+        'txt': content.encode('utf-8'),
+        'md': f"# Gemini Response\n\n{content}".encode('utf-8'),
+        'json': json.dumps(data, indent=2).encode('utf-8'),
+    }
+
+
+def export_message(msg):
+    """The exported fields of a message"""
+    return {
+        "role": msg["role"],
+        "content": msg["content"],
+        "timestamp": msg.get("timestamp", datetime.now().isoformat())
+    }
+
+
+def chat_export(messages, chat_id):
+    """A whole chat as JSON bytes"""
+    chat_data = {
+        "chat_id": chat_id,
+        "messages": [export_message(msg) for msg in messages],
+        "export_timestamp": datetime.now().isoformat()
+    }
+    return json.dumps(chat_data, indent=2).encode('utf-8')
+
+
+def _jsonl_lines(chat_id, messages):
+    for seq, msg in enumerate(messages):
+        line = dict(chat_id=chat_id, seq=seq, **export_message(msg))
+        yield json.dumps(line, ensure_ascii=False) + "\n"
+
+
+def _markdown_lines(chat_id, messages, timestamp):
+    yield f"# Chat {chat_id}\n\n_Last saved {timestamp}_\n"
+    for msg in messages:
+        speaker = "You" if msg["role"] == "user" else "Gemini"
+        yield f"\n### {speaker} ({msg.get('timestamp', '')})\n\n{msg['content']}\n"
+
+
+def _text_lines(chat_id, messages, timestamp):
+    yield f"Chat {chat_id} (last saved {timestamp})\n"
+    for msg in messages:
+        yield f"\n[{msg.get('timestamp', '')}] {msg['role']}:\n{msg['content']}\n"
+
+
+def chat_lines(export_format, chat_id, messages, timestamp):
+    """One chat in export_format, as an iterator of text pieces"""
+    if export_format == "jsonl":
+        return _jsonl_lines(chat_id, messages)
+    if export_format == "md":
+        return _markdown_lines(chat_id, messages, timestamp)
+    return _text_lines(chat_id, messages, timestamp)
+
+
+def archive_name(export_format, summary):
+    directory, extension = EXPORT_FORMATS[export_format]
+    chat_id = re.sub(r'[^\w.-]', '_', summary["chat_id"])
+    return f"{directory}/{summary['timestamp'][:10]}_{chat_id}.{extension}"
+
+
+def selected_chats(chat_storage, start=None, end=None, chat_ids=None):
+    """Summaries of the chats to export: the given ids, or every chat in the date range"""
+    wanted = set(chat_ids) if chat_ids is not None else None
+    # Picked from the summaries, so no chat's messages are read before they are written
+    for summary in chat_storage.iter_chats(start=start, end=end):
+        if wanted is None:
+            yield summary
+        elif summary["chat_id"] in wanted:
+            wanted.discard(summary["chat_id"])
+            yield summary
+            if not wanted:
+                return
+
+
+def export_chats(chat_storage, output, formats=("jsonl",), start=None, end=None, chat_ids=None, progress=None,
+                 compresslevel=EXPORT_COMPRESSLEVEL):
+    """Write the selected chats to output (a path or binary file) as a ZIP archive.
+
+    Filters are as for storage.ChatStorage.iter_chats. progress, if given, is
+    called after each chat with (chats done, chats expected or None,
+    messages done). Returns the counts of chats and messages exported.
+    """
+    for export_format in formats:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {export_format!r}, expected one of {sorted(EXPORT_FORMATS)}")
+    if chat_ids is not None:
+        expected = len(set(chat_ids))
+    elif start is None and end is None:
+        expected = chat_storage.count_chats()
+    else:
+        expected = None
+
+    chats = messages = 0
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        for summary in selected_chats(chat_storage, start, end, chat_ids):
+            for export_format in formats:
+                # Each format re-reads the chat: only one archive entry can be open for writing
+                count = [0]
+                chat_messages = _counting(chat_storage.iter_messages(summary["chat_id"]), count)
+                # force_zip64: the entry's size isn't known until it has been streamed
+                with archive.open(archive_name(export_format, summary), "w", force_zip64=True) as entry:
+                    buffer = []
+                    buffered = 0
+                    for piece in chat_lines(export_format, summary["chat_id"], chat_messages, summary["timestamp"]):
+                        buffer.append(piece)
+                        buffered += len(piece)
+                        if buffered >= EXPORT_WRITE_BYTES:
+                            entry.write("".join(buffer).encode("utf-8"))
+                            buffer = []
+                            buffered = 0
+                    entry.write("".join(buffer).encode("utf-8"))
+            chats += 1
+            messages += count[0]
+            if progress:
+                progress(chats, expected, messages)
+    return {"chats": chats, "messages": messages}
+
+
+def _counting(items, count):
+    for item in items:
+        count[0] += 1
+        yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export stored conversations to a ZIP archive")
+    parser.add_argument("-o", "--output", required=True, help="ZIP file to write")
+    parser.add_argument("--format", action="append", choices=sorted(EXPORT_FORMATS), dest="formats",
+                        help="repeat for several formats (default: jsonl)")
+    parser.add_argument("--start", help="first date (or ISO timestamp) of last save to include")
+    parser.add_argument("--end", help="last date (or ISO timestamp) of last save to include")
+    parser.add_argument("--chat-id", action="append", dest="chat_ids", help="export only this chat; repeatable")
+    parser.add_argument("--backend", default="sqlite", choices=sorted(storage.STORAGE_BACKENDS))
+    parser.add_argument("--db", help="storage file (default: the app's)")
+    args = parser.parse_args()
+
+    def progress(chats, expected, messages):
+        total = f"/{expected}" if expected is not None else ""
+        print(f"\r{chats}{total} chats, {messages} messages", end="", file=sys.stderr, flush=True)
+
+    chat_storage = storage.open_storage(args.backend, args.db)
+    try:
+        counts = export_chats(chat_storage, args.output, args.formats or ["jsonl"], args.start, args.end,
+                              args.chat_ids, progress=progress)
+    finally:
+        chat_storage.close()
+    print(file=sys.stderr)
+    print(f"Exported {counts['chats']} chats ({counts['messages']} messages) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""On-disk cache of extracted upload content, shared by the app and batch_runner.
+
+Extraction (PDF text, DOCX paragraphs, data file profiles, prepared images)
+is the slow part of an upload; this caches its result by a hash of the file
+bytes and the options that change it, so reruns, re-uploads and repeated
+batch attachments skip parsing. Like extractors, it has no Streamlit imports.
+"""
+import hashlib
+import threading
+
+import extractors
+from disk_lru import DiskLRU
+
+# Bump whenever extractors or data_profiler change what they produce, so stale entries are ignored
+EXTRACTOR_VERSION = 6
+DEFAULT_CACHE_DIR = ".extraction_cache"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def extraction_options(page_range=None, full_text=False):
+    """Extraction settings that change the extracted text, as a cache key component"""
+    options = []
+    if page_range:
+        options.append(f"pages={page_range}")
+    if full_text:
+        options.append("full")
+    return ";".join(options)
+
+
+class ExtractionCache:
+    """On-disk, content-addressed cache of extracted file content with LRU eviction.
+
+    Entries are keyed by a hash of the file bytes, the file extension, any
+    extraction options (e.g. a PDF page range) and EXTRACTOR_VERSION. Text is
+    stored as .txt, images as their prepared image bytes in .img files, in a
+    DiskLRU capped at max_bytes."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.files = DiskLRU(cache_dir, max_bytes)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_bytes, file_extension, options=""):
+        digest = hashlib.sha256(file_bytes).hexdigest()
+        if options:
+            digest += "-" + hashlib.sha256(options.encode('utf-8')).hexdigest()[:12]
+        return f"{digest}-{file_extension}-v{EXTRACTOR_VERSION}"
+
+    def get(self, key, source_size=0):
+        """Return cached text or image blob for key, or None on a miss"""
+        for suffix in ('.txt', '.img'):
+            data = self.files.read(key + suffix)
+            if data is None:
+                continue
+            with self._lock:
+                self.hits += 1
+                self.bytes_saved += source_size
+            if suffix == '.txt':
+                return data.decode('utf-8')
+            return extractors.image_blob(data)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, content):
+        """Store extracted content: text, or an image blob's prepared bytes"""
+        if isinstance(content, str):
+            self.files.write(key + '.txt', content.encode('utf-8'))
+        elif isinstance(content, dict) and "data" in content:
+            self.files.write(key + '.img', content["data"])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "size_bytes": self.files.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,245 @@
+"""File content extractors used by app.py.
+
+This module deliberately has no Streamlit imports so its functions can be
+pickled into the ingestion process pool (functions defined in the Streamlit
+script itself live in a fake __main__ and can't be sent to worker processes).
+
+Extractors are registered per file extension and import their parsing
+library (PyPDF2, python-docx, PIL, data_profiler) on first use, so starting
+the app doesn't pay for formats nobody uploads. Images come back as prepared,
+compact encoded bytes (see prepare_image); data files come back as a compact
+profile rather than their rows (see data_profiler).
+"""
+import math
+from io import BytesIO
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'webp']
+
+# extension -> extractor(file_bytes, page_range, max_chars) returning ("text"/"image", payload)
+EXTRACTORS = {}
+
+
+def register_extractor(*extensions):
+    """Register the decorated function as the extractor for extensions"""
+    def decorator(extractor):
+        for extension in extensions:
+            EXTRACTORS[extension] = extractor
+        return extractor
+    return decorator
+
+# Images are downscaled to fit this many pixels on their long side; Gemini
+# tiles larger images and bills per tile, so detail beyond this costs tokens
+MAX_IMAGE_SIDE = 1536
+JPEG_QUALITY = 85
+# Animated GIFs are sent as a contact sheet of this many evenly spaced frames
+GIF_SAMPLE_FRAMES = 4
+
+# Upper bound on extracted text kept per file; paged formats stop extracting
+# once they have this much, since the prompt never uses more
+MAX_CONTENT_CHARS = 10000
+
+
+def parse_page_range(spec):
+    """Parse a 1-based page selector such as "1-5, 8, 12-" into (start, end) pairs.
+
+    end is None for open-ended ranges. An empty spec selects every page.
+    Raises ValueError on malformed input.
+    """
+    ranges = []
+    for part in (spec or "").split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else None
+        else:
+            start = end = int(part)
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"invalid page range: {part!r}")
+        ranges.append((start, end))
+    return ranges
+
+
+def iter_pdf_pages(file_bytes, page_range=None):
+    """Lazily yield the text of each selected PDF page, in selector order.
+
+    PyPDF2 only parses a page when it is accessed, so stopping the iteration
+    early skips the remaining pages entirely.
+    """
+    import PyPDF2
+
+    pdf_reader = PyPDF2.PdfReader(BytesIO(file_bytes))
+    num_pages = len(pdf_reader.pages)
+    ranges = parse_page_range(page_range) or [(1, None)]
+
+    seen = set()
+    for start, end in ranges:
+        for page_number in range(start, min(end or num_pages, num_pages) + 1):
+            if page_number in seen:
+                continue
+            seen.add(page_number)
+            yield pdf_reader.pages[page_number - 1].extract_text() or ""
+
+
+def extract_pdf_text(file_bytes, max_chars=MAX_CONTENT_CHARS, page_range=None):
+    """Extract PDF text page by page, stopping as soon as max_chars is reached (None reads every page)"""
+    parts = []
+    total_chars = 0
+    for page_text in iter_pdf_pages(file_bytes, page_range):
+        parts.append(page_text)
+        total_chars += len(page_text) + 1
+        if max_chars and total_chars >= max_chars:
+            break
+    text = '\n'.join(parts)
+    return text[:max_chars] if max_chars else text
+
+
+def image_mime_type(data):
+    """MIME type of encoded image bytes, from their magic number"""
+    if data[:3] == b'\xff\xd8\xff':
+        return "image/jpeg"
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return "image/png"
+    if data[:4] == b'GIF8':
+        return "image/gif"
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def image_blob(data):
+    """Model input part for encoded image bytes.
+
+    The SDK sends {"mime_type", "data"} parts as-is, whereas PIL images get
+    re-encoded on every request.
+    """
+    return {"mime_type": image_mime_type(data), "data": data}
+
+
+def _contact_sheet(image, frames, max_side):
+    """Tile evenly spaced frames of an animated image into one grid image"""
+    from PIL import Image
+
+    count = min(frames, image.n_frames)
+    positions = [round(i * (image.n_frames - 1) / max(1, count - 1)) for i in range(count)]
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    # Frames are only ever shrunk, so the sheet is never bigger than it needs to be
+    scale = min(1.0, max_side / (columns * max(image.size)))
+    cell_width = max(1, int(image.width * scale))
+    cell_height = max(1, int(image.height * scale))
+
+    sheet = Image.new("RGB", (cell_width * columns, cell_height * rows), "white")
+    for slot, position in enumerate(positions):
+        image.seek(position)
+        frame = image.convert("RGB")
+        frame.thumbnail((cell_width, cell_height), Image.Resampling.LANCZOS)
+        sheet.paste(frame, ((slot % columns) * cell_width, (slot // columns) * cell_height))
+    return sheet
+
+
+def prepare_image(file_bytes, max_side=MAX_IMAGE_SIDE, gif_frames=GIF_SAMPLE_FRAMES):
+    """Normalize an uploaded image for the model and return its encoded bytes.
+
+    Applies EXIF orientation, downscales to max_side, turns animated GIFs
+    into a contact sheet of sampled frames and re-encodes as JPEG (PNG when
+    there is transparency). Uploads that need none of that and wouldn't get
+    smaller are passed through untouched.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(file_bytes)) as image:
+        original_format = image.format
+        if getattr(image, "is_animated", False) and image.n_frames > 1:
+            prepared = _contact_sheet(image, gif_frames, max_side)
+            changed = True
+        else:
+            # 0x0112 is the EXIF Orientation tag; 1 means already upright
+            changed = image.getexif().get(0x0112, 1) != 1
+            # Always returns a new image, so it outlives the file handle
+            prepared = ImageOps.exif_transpose(image)
+        if max(prepared.size) > max_side:
+            prepared.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            changed = True
+
+        has_alpha = prepared.mode in ("RGBA", "LA") or (
+            prepared.mode == "P" and "transparency" in prepared.info
+        )
+        buffer = BytesIO()
+        if has_alpha:
+            prepared.convert("RGBA").save(buffer, "PNG", optimize=True)
+        else:
+            prepared.convert("RGB").save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    prepared_bytes = buffer.getvalue()
+    if not changed and original_format in ("JPEG", "PNG", "WEBP") and len(prepared_bytes) >= len(file_bytes):
+        return file_bytes
+    return prepared_bytes
+
+
+@register_extractor(*IMAGE_EXTENSIONS)
+def extract_image(file_bytes, page_range, max_chars):
+    # Returns the prepared image's encoded bytes rather than a decoded image:
+    # shipping pixels back from a worker costs far more, and the extraction
+    # cache keeps the prepared bytes so this runs once per image
+    return "image", prepare_image(file_bytes)
+
+
+@register_extractor('pdf')
+def extract_pdf(file_bytes, page_range, max_chars):
+    return "text", extract_pdf_text(file_bytes, max_chars=max_chars, page_range=page_range)
+
+
+@register_extractor('txt', 'md')
+def extract_plain_text(file_bytes, page_range, max_chars):
+    return "text", str(file_bytes, "utf-8")
+
+
+@register_extractor('docx')
+def extract_docx(file_bytes, page_range, max_chars):
+    import docx
+
+    doc = docx.Document(BytesIO(file_bytes))
+    return "text", '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+
+
+@register_extractor('csv')
+def extract_csv(file_bytes, page_range, max_chars):
+    import data_profiler
+
+    return "text", data_profiler.profile_csv(file_bytes)
+
+
+@register_extractor('json')
+def extract_json(file_bytes, page_range, max_chars):
+    import data_profiler
+
+    return "text", data_profiler.profile_json(file_bytes)
+
+
+@register_extractor('xlsx')
+def extract_xlsx(file_bytes, page_range, max_chars):
+    import data_profiler
+
+    return "text", data_profiler.profile_xlsx(file_bytes)
+
+
+def extract_content(file_bytes, file_extension, page_range=None, max_chars=MAX_CONTENT_CHARS):
+    """Extract an uploaded file's content from its raw bytes.
+
+    page_range optionally restricts PDFs to a page selector (see parse_page_range).
+    max_chars caps the text kept; None keeps the whole document (for retrieval
+    indexing). CSV, JSON and XLSX are always summarized.
+
+    Returns ("text", str) or ("image", bytes); unknown extensions give empty
+    text. Raises on unreadable files.
+    """
+    extractor = EXTRACTORS.get(file_extension)
+    if extractor is None:
+        return "text", ""
+    kind, content = extractor(file_bytes, page_range, max_chars)
+    if kind == "text" and max_chars:
+        content = content[:max_chars]
+    return kind, content
@@ -0,0 +1,183 @@
+"""Deterministic offline stand-in for google.generativeai.GenerativeModel.
+
+FakeGenerativeModel answers with a reproducible echo of the request after a
+configurable latency, can inject rate-limit errors, and supports streaming
+and count_tokens, so the request engine, batch runner and benchmarks can run
+without network access or quota. FakeCacheBackend stands in for the caching
+API behind context_cache.ContextCache.
+"""
+import hashlib
+import random
+import threading
+import time
+
+
+class FakeRateLimitError(Exception):
+    """Looks like the API's 429 to request_engine.is_retryable"""
+
+    code = 429
+
+
+class FakePart:
+    mime_type = "text/plain"
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Mimics GenerateContentResponse: .text, .parts, and iteration over chunks"""
+
+    def __init__(self, chunks, chunk_delay=0.0):
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    @property
+    def parts(self):
+        return [FakePart(self.text)]
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield FakeResponse([chunk])
+
+
+def content_size(contents):
+    """Bytes a request carries: text as UTF-8, image parts as their data"""
+    if isinstance(contents, str):
+        return len(contents.encode('utf-8'))
+    return sum(
+        len(part.encode('utf-8')) if isinstance(part, str) else len(part.get("data", b"")) if isinstance(part, dict) else 0
+        for part in contents
+    )
+
+
+class FakeTokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class FakeGenerativeModel:
+    """Offline model with deterministic output.
+
+    latency is the time before a response (or the first chunk) is available;
+    fail_first makes that many initial calls raise FakeRateLimitError and
+    failure_rate injects them at random afterwards (seeded, so reproducible).
+    bytes_received totals the request bytes of every call.
+    """
+
+    def __init__(self, model_name="models/fake-gemini", latency=0.05, chunk_chars=40,
+                 chunk_delay=0.0, fail_first=0, failure_rate=0.0, seed=0, input_token_limit=1048576):
+        self.model_name = model_name
+        # Real models report this through genai.get_model(); ChatEngine reads it from here
+        self.input_token_limit = input_token_limit
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.fail_first = fail_first
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _text_parts(contents):
+        if isinstance(contents, str):
+            return [contents]
+        return [part if isinstance(part, str) else f"<{type(part).__name__}>" for part in contents]
+
+    def generate_content(self, contents, stream=False, cached_content=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.bytes_received += content_size(contents)
+            fail = self.calls <= self.fail_first or self._random.random() < self.failure_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise FakeRateLimitError("429 Resource has been exhausted (fake)")
+
+        text_parts = self._text_parts(contents)
+        if cached_content is not None:
+            if time.time() >= cached_content.expires_at:
+                raise FakeNotFoundError(f"404 {cached_content.name} has expired (fake)")
+            # Answered as if the cached contents were sent first
+            text_parts = self._text_parts(cached_content.contents) + text_parts
+        request = "\n".join(text_parts)
+        digest = hashlib.sha256(request.encode('utf-8')).hexdigest()[:12]
+        answer = f"[fake:{digest}] You asked: {text_parts[-1].strip()[:200]}"
+        chunks = [answer[i:i + self.chunk_chars] for i in range(0, len(answer), self.chunk_chars)]
+        return FakeResponse(chunks, self.chunk_delay if stream else 0.0)
+
+    def count_tokens(self, contents):
+        return FakeTokenCount(max(1, len("".join(self._text_parts(contents))) // 4))
+
+
+class FakeNotFoundError(Exception):
+    code = 404
+
+
+class FakeCachedContent:
+    def __init__(self, name, model_name, contents, expires_at):
+        self.name = name
+        self.model_name = model_name
+        self.contents = contents
+        self.expires_at = expires_at
+
+
+class FakeCachedModel:
+    """A FakeGenerativeModel bound to cached contents, like GenerativeModel.from_cached_content"""
+
+    def __init__(self, model, cached_content):
+        self.model = model
+        self.cached_content = cached_content
+        self.model_name = model.model_name
+        self.input_token_limit = model.input_token_limit
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        return self.model.generate_content(contents, stream=stream, cached_content=self.cached_content, **kwargs)
+
+    def count_tokens(self, contents):
+        return self.model.count_tokens(contents)
+
+
+class FakeCacheBackend:
+    """In-memory stand-in for the Gemini caching API (a context_cache backend).
+
+    bytes_uploaded totals the contents sent to create caches, so it can be
+    set against the bytes the cached turns no longer send.
+    """
+
+    def __init__(self):
+        self.caches = {}
+        self.created = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, contents, ttl_seconds):
+        with self._lock:
+            self.created += 1
+            self.bytes_uploaded += content_size(contents)
+            name = f"cachedContents/fake-{self.created}"
+            cached = self.caches[name] = FakeCachedContent(
+                name, model.model_name, list(contents), time.time() + ttl_seconds
+            )
+        return cached
+
+    def refresh(self, handle, ttl_seconds):
+        with self._lock:
+            if handle.name not in self.caches or time.time() >= handle.expires_at:
+                raise FakeNotFoundError(f"404 {handle.name} not found (fake)")
+            handle.expires_at = time.time() + ttl_seconds
+
+    def bind(self, model, handle):
+        return FakeCachedModel(model, handle)
+
+    def delete(self, handle):
+        with self._lock:
+            self.caches.pop(handle.name, None)
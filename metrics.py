@@ -0,0 +1,158 @@
+"""Per-stage latency, size and token metrics for the chat's hot paths.
+
+A MetricsRegistry records one observation per stage run (file parsing,
+context assembly, the model call, TTS, saving, rendering): its duration and
+optionally the bytes and tokens it handled. Each stage keeps cumulative
+Prometheus-style histogram buckets plus a rolling window of recent samples
+for percentiles, so the diagnostics panel reflects current behaviour while
+the exported counters stay monotonic.
+
+Like the other helper modules it has no Streamlit imports; app.py shares one
+registry per process and batch_runner.py gets one per run.
+"""
+import contextlib
+import math
+import threading
+import time
+from collections import deque
+
+# Upper bounds, in seconds, of the duration histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent samples per stage that percentiles are computed over
+DEFAULT_WINDOW = 500
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class StageMetrics:
+    """Everything recorded for one stage"""
+
+    def __init__(self, bucket_count, window):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.bytes = 0
+        self.tokens = 0
+        # (seconds, bytes, tokens) of the most recent runs
+        self.recent = deque(maxlen=window)
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=DEFAULT_WINDOW, namespace="gemini_chat"):
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.namespace = namespace
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, size=None, tokens=None, error=False):
+        """Record one run of stage; size is in bytes"""
+        with self._lock:
+            metrics = self._stages.get(stage)
+            if metrics is None:
+                metrics = self._stages[stage] = StageMetrics(len(self.buckets), self.window)
+            metrics.count += 1
+            metrics.seconds += seconds
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    metrics.bucket_counts[position] += 1
+                    break
+            if error:
+                metrics.errors += 1
+            if size:
+                metrics.bytes += size
+            if tokens:
+                metrics.tokens += tokens
+            metrics.recent.append((seconds, size, tokens))
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Time the block as one run of stage.
+
+        Yields a dict the block can fill with "bytes" and "tokens"; a block
+        that raises is recorded as an error.
+        """
+        sample = {}
+        error = False
+        start = time.perf_counter()
+        try:
+            yield sample
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, sample.get("bytes"), sample.get("tokens"), error)
+
+    def summary(self):
+        """One row per stage over its recent window: runs, latency percentiles (ms), mean bytes/tokens"""
+        with self._lock:
+            stages = [(stage, metrics.count, metrics.errors, list(metrics.recent))
+                      for stage, metrics in self._stages.items()]
+        rows = []
+        for stage, count, errors, recent in sorted(stages):
+            durations = sorted(seconds * 1000 for seconds, _, _ in recent)
+            sizes = [size for _, size, _ in recent if size]
+            tokens = [token_count for _, _, token_count in recent if token_count]
+            rows.append({
+                "stage": stage,
+                "runs": count,
+                "errors": errors,
+                "p50_ms": round(percentile(durations, 0.50), 1),
+                "p95_ms": round(percentile(durations, 0.95), 1),
+                "p99_ms": round(percentile(durations, 0.99), 1),
+                "max_ms": round(durations[-1], 1),
+                "mean_kb": round(sum(sizes) / len(sizes) / 1024, 1) if sizes else None,
+                "mean_tokens": round(sum(tokens) / len(tokens)) if tokens else None,
+            })
+        return rows
+
+    def prometheus_text(self):
+        """All stages in the Prometheus text exposition format"""
+        with self._lock:
+            stages = sorted(
+                (stage, list(metrics.bucket_counts), metrics.count, metrics.seconds,
+                 metrics.errors, metrics.bytes, metrics.tokens)
+                for stage, metrics in self._stages.items()
+            )
+
+        duration = f"{self.namespace}_stage_duration_seconds"
+        lines = [
+            f"# HELP {duration} Time spent in each stage of a chat turn.",
+            f"# TYPE {duration} histogram",
+        ]
+        for stage, bucket_counts, count, seconds, _, _, _ in stages:
+            label = f'stage="{escape_label(stage)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{duration}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{duration}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{duration}_sum{{{label}}} {seconds:.6f}")
+            lines.append(f"{duration}_count{{{label}}} {count}")
+
+        counters = [
+            ("stage_errors_total", "Stage runs that raised.", 4),
+            ("stage_bytes_total", "Bytes handled by each stage.", 5),
+            ("stage_tokens_total", "Tokens handled by each stage.", 6),
+        ]
+        for name, help_text, field in counters:
+            name = f"{self.namespace}_{name}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for row in stages:
+                lines.append(f'{name}{{stage="{escape_label(row[0])}"}} {row[field]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
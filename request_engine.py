@@ -0,0 +1,162 @@
+"""Shared, rate-limited engine for Gemini generate_content and count_tokens calls.
+
+One RequestEngine is meant to be shared by every session in the process. It
+runs an asyncio loop on a background thread and gives each API key a token
+bucket, caps the number of concurrent calls, retries retryable errors (429s,
+5xx, timeouts) with exponential backoff and jitter, and coalesces identical
+non-streaming requests that are in flight at the same time.
+
+Synchronous callers use generate(); async callers can await agenerate() on
+the engine's loop. count_tokens() gets its own bucket per key, since the API
+meters counting separately, and gives up after one retry: its callers can
+fall back to a local estimate. Models only need blocking
+generate_content(contents, stream=...) and count_tokens(contents), so
+fake_gemini.FakeGenerativeModel can stand in for tests.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import random
+import threading
+import time
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+}
+
+
+def is_retryable(error):
+    """True for quota, overload and transient transport errors"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    try:
+        return int(code) in RETRYABLE_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+class TokenBucket:
+    """Async token bucket: rate tokens per second, holding at most capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class RequestEngine:
+    def __init__(self, requests_per_minute=30, burst=10, max_concurrency=8,
+                 max_retries=4, base_delay=1.0, max_delay=30.0, counts_per_minute=3000, count_retries=1):
+        self.requests_per_second = requests_per_minute / 60
+        self.counts_per_second = counts_per_minute / 60
+        self.count_retries = count_retries
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"requests": 0, "calls": 0, "retries": 0, "coalesced": 0, "failures": 0, "throttled_seconds": 0.0,
+                      "token_counts": 0}
+
+        self._buckets = {}
+        self._in_flight = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="gemini-call"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gemini-requests", daemon=True)
+        self._thread.start()
+
+    def generate(self, model, contents, stream=False, api_key="", coalesce_key=None, timeout=None):
+        """Blocking generate_content through the engine; raises the last error if retries run out"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate(model, contents, stream, api_key, coalesce_key), self._loop
+        )
+        return future.result(timeout)
+
+    async def agenerate(self, model, contents, stream=False, api_key="", coalesce_key=None):
+        """Must run on the engine's loop (see generate and run)"""
+        self.stats["requests"] += 1
+        # A stream can only be consumed once, so only resolved responses are shared
+        call = functools.partial(model.generate_content, contents, stream=stream)
+        if coalesce_key is None or stream:
+            return await self._call_with_retries(call, self._bucket(api_key), self.max_retries)
+
+        task = self._in_flight.get(coalesce_key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._call_with_retries(call, self._bucket(api_key), self.max_retries))
+            self._in_flight[coalesce_key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(coalesce_key, None))
+        # shield: one caller giving up must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def count_tokens(self, model, contents, api_key="", timeout=None):
+        """Blocking count_tokens through the engine; returns the response's total_tokens"""
+        self.stats["token_counts"] += 1
+        call = functools.partial(model.count_tokens, contents)
+        future = asyncio.run_coroutine_threadsafe(
+            self._call_with_retries(call, self._bucket(api_key, counting=True), self.count_retries), self._loop
+        )
+        return future.result(timeout).total_tokens
+
+    def run(self, coroutine, timeout=None):
+        """Run a coroutine (e.g. a gather of agenerate calls) on the engine's loop and wait for it"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def _bucket(self, api_key, counting=False):
+        bucket = self._buckets.get((api_key, counting))
+        if bucket is None:
+            rate = self.counts_per_second if counting else self.requests_per_second
+            bucket = self._buckets[(api_key, counting)] = TokenBucket(rate, self.burst)
+        return bucket
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with equal jitter: half the step fixed, half random"""
+        step = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return step / 2 + random.uniform(0, step / 2)
+
+    async def _call_with_retries(self, call, bucket, max_retries):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            self.stats["throttled_seconds"] += await bucket.acquire()
+            async with self._semaphore:
+                self.stats["calls"] += 1
+                try:
+                    return await loop.run_in_executor(self._executor, call)
+                except Exception as e:
+                    if attempt >= max_retries or not is_retryable(e):
+                        self.stats["failures"] += 1
+                        raise
+            self.stats["retries"] += 1
+            await asyncio.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
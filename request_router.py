@@ -0,0 +1,103 @@
+"""Decides which kind of model request a chat turn is, before any model call.
+
+A turn is one of three modes: "text" (plain chat), "image" (image
+generation) or "file_analysis" (chat over the uploaded files). The user can
+pick the mode explicitly; in "auto" mode the router looks for an explicit
+request for a picture with one precompiled, word-boundary pattern, so
+"drawback" or "what design pattern fits here?" stay text, and otherwise
+routes to file analysis when files are uploaded.
+
+ChatEngine makes at most one model call for whatever the router decides;
+when image generation fails the turn reports the failure instead of paying
+for a second, text-only call.
+"""
+import re
+import threading
+from collections import Counter
+
+MODE_AUTO = "auto"
+MODE_TEXT = "text"
+MODE_IMAGE = "image"
+MODE_FILE_ANALYSIS = "file_analysis"
+MODES = (MODE_AUTO, MODE_TEXT, MODE_IMAGE, MODE_FILE_ANALYSIS)
+
+_IMAGE_NOUNS = r"(?:image|picture|photo|drawing|illustration|graphic|logo|poster|sketch|painting|wallpaper)s?"
+_DETERMINERS = r"(?:a few|a couple of|an?|some|\d+|two|three|four|five)"
+# The only words allowed between the determiner and the noun; anything else
+# ("my photos", "images in React") reads as a question about existing pictures
+_ADJECTIVES = (
+    r"(?:beautiful|realistic|photorealistic|simple|cute|colorful|detailed|new|small|large|"
+    r"cartoon|abstract|minimalist|vintage|modern|funny|digital|3d)"
+)
+
+IMAGE_REQUEST_PATTERN = re.compile(
+    # "create an image of...", "generate me a cute picture", "design a logo", "make images of..."
+    rf"\b(?:create|generate|make|draw|design|paint|render|produce)\s+(?:me\s+)?"
+    rf"(?:{_DETERMINERS}\s+(?:{_ADJECTIVES}\s+)?{_IMAGE_NOUNS}\b|(?:{_ADJECTIVES}\s+)?{_IMAGE_NOUNS}\s+of\b)"
+    # ...or a request that starts with a drawing verb: "draw a cat", "please sketch some trees"
+    r"|^(?:please\s+|can you\s+|could you\s+)?(?:draw|sketch|paint)\s+(?:me\s+)?(?:an?|some)\b",
+    re.IGNORECASE,
+)
+
+# The [Professional style] / [Brief response] prefixes chat_engine.style_prompt adds
+STYLE_PREFIX_PATTERN = re.compile(r'\[.*?\]\s*')
+
+
+def strip_style_prefixes(prompt):
+    return STYLE_PREFIX_PATTERN.sub('', prompt).strip()
+
+
+class RouteDecision:
+    """Which mode a turn was routed to, and why"""
+
+    def __init__(self, mode, reason, matched=None):
+        self.mode = mode
+        self.reason = reason
+        self.matched = matched
+
+    def as_dict(self):
+        return {"mode": self.mode, "reason": self.reason, "matched": self.matched}
+
+    def __repr__(self):
+        return f"RouteDecision({self.mode!r}, {self.reason!r})"
+
+
+class RequestRouter:
+    """Routes turns and counts the decisions (see stats)"""
+
+    def __init__(self, pattern=IMAGE_REQUEST_PATTERN):
+        self.pattern = pattern
+        self.decisions = Counter()
+        self._lock = threading.Lock()
+
+    def match_image_request(self, prompt):
+        """The phrase that makes prompt an image generation request, or None"""
+        match = self.pattern.search(strip_style_prefixes(prompt))
+        return match.group(0) if match else None
+
+    def route(self, prompt, files=None, mode=MODE_AUTO, image_available=True):
+        if mode not in MODES:
+            raise ValueError(f"Unknown request mode: {mode!r}")
+        if mode == MODE_IMAGE:
+            decision = (RouteDecision(MODE_IMAGE, "explicit") if image_available
+                        else RouteDecision(MODE_FILE_ANALYSIS if files else MODE_TEXT, "no image model"))
+        elif mode == MODE_TEXT:
+            decision = RouteDecision(MODE_TEXT, "explicit")
+        elif mode == MODE_FILE_ANALYSIS:
+            decision = (RouteDecision(MODE_FILE_ANALYSIS, "explicit") if files
+                        else RouteDecision(MODE_TEXT, "no files uploaded"))
+        else:
+            matched = self.match_image_request(prompt) if image_available else None
+            if matched:
+                decision = RouteDecision(MODE_IMAGE, "image request", matched)
+            elif files:
+                decision = RouteDecision(MODE_FILE_ANALYSIS, "files uploaded")
+            else:
+                decision = RouteDecision(MODE_TEXT, "default")
+        with self._lock:
+            self.decisions[decision.mode] += 1
+        return decision
+
+    def stats(self):
+        with self._lock:
+            return dict(self.decisions)
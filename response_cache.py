@@ -0,0 +1,140 @@
+"""Opt-in local cache of model responses for identical requests.
+
+Requests are keyed by a canonical hash of the model name and the assembled
+model input (text parts as-is, images by content digest). Entries live in a
+small SQLite file with a TTL and are evicted least-recently-used beyond
+max_entries.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_RESPONSE_CACHE_PATH = 'response_cache.db'
+
+
+class CachedResponse:
+    """Stand-in for a GenerateContentResponse served from the cache.
+
+    Iterating it yields itself once, so streaming consumers treat it as a
+    single chunk.
+    """
+
+    from_cache = True
+
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        yield self
+
+
+class CachingStream:
+    """Pass a streamed response through, handing the assembled text to on_complete at the end.
+
+    If the consumer stops early nothing is stored.
+    """
+
+    from_cache = False
+
+    def __init__(self, response, on_complete):
+        self.response = response
+        self.on_complete = on_complete
+
+    def __iter__(self):
+        parts = []
+        for chunk in self.response:
+            try:
+                text = chunk.text
+            except Exception:
+                text = None
+            if text:
+                parts.append(text)
+            yield chunk
+        self.on_complete("".join(parts))
+
+
+def make_request_key(model_name, model_input, image_digest):
+    """Canonical hash of a request; image_digest maps a non-text part to a stable digest"""
+    parts = []
+    for part in model_input:
+        if isinstance(part, str):
+            parts.append(["text", part])
+        else:
+            parts.append(["image", image_digest(part)])
+    canonical = json.dumps([model_name, parts], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+    """
+
+    def __init__(self, path=DEFAULT_RESPONSE_CACHE_PATH, ttl_seconds=24 * 3600, max_entries=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(self.SCHEMA)
+
+    def get(self, key):
+        """Return the cached response text for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model_name, text):
+        if not text:
+            return
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, text, now, now)
+            )
+            # Expired entries go first, then the least recently used beyond max_entries
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+            }
@@ -0,0 +1,190 @@
+"""Local retrieval over uploaded documents: chunk, embed, top-k.
+
+Documents are split with context_builder.split_into_chunks, embedded by a
+pluggable embedder and kept as a normalized NumPy matrix, so a query is one
+matrix-vector product. Indexes are persisted per file hash and built once.
+
+An embedder is any object with a ``name`` (part of the on-disk key), a
+``uses_idf`` flag and ``embed(texts) -> np.ndarray`` of shape (len(texts), dim).
+"""
+import json
+import os
+import re
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from context_builder import split_into_chunks
+
+RETRIEVAL_INDEX_DIR = ".retrieval_index"
+DEFAULT_TOP_K = 8
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=65536)
+def _bucket(token, dim):
+    # crc32 rather than hash(): str hashes are salted per process, and indexes outlive processes
+    return zlib.crc32(token.encode('utf-8')) % dim
+
+
+class HashingEmbedder:
+    """Hashed bag-of-words vectors with sublinear term frequency.
+
+    Needs no vocabulary or network, so it works offline; the index applies
+    IDF weights learned from each document's own chunks (uses_idf).
+    """
+
+    uses_idf = True
+
+    def __init__(self, dim=2048):
+        self.dim = dim
+        self.name = f"hash-tfidf-{dim}"
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_RE.findall(text.lower())
+            if not tokens:
+                continue
+            columns = np.fromiter((_bucket(token, self.dim) for token in tokens), dtype=np.int64, count=len(tokens))
+            matrix[row] = np.bincount(columns, minlength=self.dim)
+        np.log1p(matrix, out=matrix)
+        return matrix
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class DocumentIndex:
+    """Chunks of one document and their L2-normalized embedding matrix"""
+
+    def __init__(self, chunks, vectors, idf=None):
+        self.chunks = chunks
+        self.vectors = vectors
+        self.idf = idf
+
+    @classmethod
+    def build(cls, text, embedder):
+        chunks = split_into_chunks(text)
+        vectors = embedder.embed(chunks) if chunks else np.zeros((0, 1), dtype=np.float32)
+        idf = None
+        if embedder.uses_idf and len(chunks):
+            document_frequency = np.count_nonzero(vectors, axis=0)
+            idf = (np.log((1 + len(chunks)) / (1 + document_frequency)) + 1).astype(np.float32)
+            vectors = vectors * idf
+        return cls(chunks, _normalize_rows(vectors).astype(np.float32), idf)
+
+    def search(self, query_vector, k=DEFAULT_TOP_K):
+        """Return [(score, position), ...] for the k chunks most similar to query_vector"""
+        if not self.chunks:
+            return []
+        if self.idf is not None:
+            query_vector = query_vector * self.idf
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return []
+        scores = self.vectors @ (query_vector / norm)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+    def save(self, path):
+        arrays = {
+            "vectors": self.vectors,
+            "chunks": np.frombuffer(json.dumps(self.chunks).encode('utf-8'), dtype=np.uint8),
+        }
+        if self.idf is not None:
+            arrays["idf"] = self.idf
+        # Write then rename so a concurrent reader never loads a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            chunks = json.loads(data["chunks"].tobytes().decode('utf-8'))
+            idf = data["idf"] if "idf" in data.files else None
+            return cls(chunks, data["vectors"], idf)
+
+
+class RetrievalStore:
+    """Builds, persists and serves document indexes keyed by file content hash"""
+
+    def __init__(self, index_dir=RETRIEVAL_INDEX_DIR, embedder=None, max_loaded=8):
+        self.index_dir = index_dir
+        self.embedder = embedder or HashingEmbedder()
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.index_dir, f"{key}-{self.embedder.name}.npz")
+
+    def _remember(self, key, index):
+        with self._lock:
+            self._loaded[key] = index
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+    def has_index(self, key):
+        with self._lock:
+            if key in self._loaded:
+                return True
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Return the index for key from memory or disk, or None if it was never built"""
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+        try:
+            index = DocumentIndex.load(self._path(key))
+        except (OSError, ValueError, KeyError):
+            return None
+        self._remember(key, index)
+        return index
+
+    def get_or_build(self, key, text):
+        """Return the index for key, building and persisting it from text if needed"""
+        index = self.get(key)
+        if index is None:
+            index = DocumentIndex.build(text, self.embedder)
+            try:
+                index.save(self._path(key))
+            except OSError:
+                pass
+            self._remember(key, index)
+        return index
+
+    def search(self, keys, query, k=DEFAULT_TOP_K):
+        """Top-k chunks across the documents in keys.
+
+        Returns [(score, document_number, position, chunk), ...] best first,
+        where document_number is the position of the document's key in keys.
+        """
+        query_vector = self.embedder.embed([query])[0]
+        results = []
+        for document_number, key in enumerate(keys):
+            index = self.get(key)
+            if index is None:
+                continue
+            for score, position in index.search(query_vector, k):
+                if score <= 0:
+                    # Shares no terms with the query
+                    continue
+                results.append((score, document_number, position, index.chunks[position]))
+        results.sort(key=lambda result: -result[0])
+        return results[:k]
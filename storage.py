@@ -0,0 +1,540 @@
+"""Chat storage backends used by app.py.
+
+Both backends store a chat as {"chat_id", "messages", "timestamp"} where each
+message is {"role", "content", "timestamp"}. Pick one with open_storage().
+"""
+import contextlib
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+
+DEFAULT_TINYDB_PATH = 'chat_history.json'
+DEFAULT_SQLITE_PATH = 'chat_history.db'
+
+logger = logging.getLogger(__name__)
+
+TITLE_CHARS = 80
+SNIPPET_TOKENS = 12
+
+
+def search_terms(query):
+    """The words of a free-text search query, lowercased"""
+    return re.findall(r'\w+', query.lower())
+
+
+def make_snippet(content, terms, width=120):
+    """Excerpt of content around the first matching term, with matches wrapped in **"""
+    lowered = content.lower()
+    hits = [lowered.find(term) for term in terms if term in lowered]
+    start = max(0, min(hits) - width // 3) if hits else 0
+    snippet = content[start:start + width]
+    for term in terms:
+        snippet = re.sub(f"({re.escape(term)})", r"**\1**", snippet, flags=re.IGNORECASE)
+    return ("…" if start else "") + snippet + ("…" if start + width < len(content) else "")
+
+
+class ChatStorage:
+    """Interface shared by the storage backends"""
+
+    def save_chat(self, chat_id, messages, timestamp):
+        """Persist the full message list of a chat (already made serializable)"""
+        raise NotImplementedError
+
+    def append_messages(self, chat_id, messages, start_seq, timestamp):
+        """Append messages that follow the start_seq messages already stored for chat_id.
+
+        Returns False without writing anything when the store doesn't hold
+        exactly start_seq messages for the chat (it was cleared, or saved from
+        elsewhere); the caller then has to save the whole chat with save_chat.
+        Backends without a cheaper path fall back to rewriting the whole chat.
+        """
+        chat = self.load_chat(chat_id)
+        stored = chat["messages"] if chat else []
+        if len(stored) != start_seq:
+            return False
+        self.save_chat(chat_id, stored + list(messages), timestamp)
+        return True
+
+    def compact(self):
+        """Reclaim space left behind by appends; called periodically by the backend itself"""
+        pass
+
+    def load_chat(self, chat_id):
+        """Return the stored chat dict, or None if there is no such chat"""
+        raise NotImplementedError
+
+    def count_chats(self):
+        raise NotImplementedError
+
+    def list_chats(self, before=None, limit=20):
+        """Newest-first page of chat summaries.
+
+        Each summary is {"chat_id", "timestamp", "message_count", "title"}, the
+        title being the start of the first message. Pass the (timestamp,
+        chat_id) of the last summary of a page as before to get the next one.
+        """
+        raise NotImplementedError
+
+    def iter_chats(self, start=None, end=None, page_size=200):
+        """Summaries (see list_chats) of every stored chat, newest first, one page in memory at a time.
+
+        start and end are inclusive ISO dates or timestamps compared with each
+        chat's last save, so end="2024-01-31" includes that whole day.
+        """
+        # Any ISO timestamp that starts with end sorts below end + U+FFFF
+        before = (end + "\uffff", "") if end else None
+        while True:
+            page = self.list_chats(before=before, limit=page_size)
+            for summary in page:
+                if start and summary["timestamp"] < start:
+                    return
+                yield summary
+            if len(page) < page_size:
+                return
+            before = (page[-1]["timestamp"], page[-1]["chat_id"])
+
+    def iter_messages(self, chat_id):
+        """The messages of a chat in order, without holding more than the backend needs to"""
+        chat = self.load_chat(chat_id)
+        yield from chat["messages"] if chat else []
+
+    def search_messages(self, query, limit=20):
+        """Up to limit stored messages containing every word of query, most recently saved first.
+
+        Returns [{"chat_id", "seq", "role", "timestamp", "snippet"}], where seq
+        is the message's position in its chat and matched terms in snippet
+        are wrapped in **.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Delete every stored chat"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class TinyDBStorage(ChatStorage):
+    """The original JSON-file store. Every save rewrites the whole file.
+
+    TinyDB isn't thread-safe, so one instance should be shared per file and
+    every operation goes through its lock.
+    """
+
+    def __init__(self, path=DEFAULT_TINYDB_PATH):
+        # Optional backend, so only imported when selected
+        from tinydb import TinyDB
+
+        self.db = TinyDB(path)
+        self._lock = threading.RLock()
+
+    def save_chat(self, chat_id, messages, timestamp):
+        from tinydb import Query
+
+        Chat = Query()
+        with self._lock:
+            self.db.remove(Chat.chat_id == chat_id)
+            self.db.insert({
+                "chat_id": chat_id,
+                "messages": messages,
+                "timestamp": timestamp
+            })
+
+    def append_messages(self, chat_id, messages, start_seq, timestamp):
+        # Hold the lock across the read-modify-write
+        with self._lock:
+            return super().append_messages(chat_id, messages, start_seq, timestamp)
+
+    def load_chat(self, chat_id):
+        from tinydb import Query
+
+        Chat = Query()
+        with self._lock:
+            results = self.db.search(Chat.chat_id == chat_id)
+        return results[0] if results else None
+
+    def count_chats(self):
+        with self._lock:
+            return len(self.db)
+
+    def list_chats(self, before=None, limit=20):
+        # No indexes here: every page sorts the whole file
+        with self._lock:
+            chats = self.db.all()
+        keys = sorted(((chat["timestamp"], chat["chat_id"]) for chat in chats), reverse=True)
+        by_id = {chat["chat_id"]: chat for chat in chats}
+        page = [key for key in keys if before is None or key < tuple(before)][:limit]
+        return [self._summary(by_id[chat_id]) for _, chat_id in page]
+
+    @staticmethod
+    def _summary(chat):
+        messages = chat.get("messages", [])
+        return {
+            "chat_id": chat["chat_id"],
+            "timestamp": chat["timestamp"],
+            "message_count": len(messages),
+            "title": messages[0]["content"][:TITLE_CHARS] if messages else "",
+        }
+
+    def search_messages(self, query, limit=20):
+        # Linear scan of every message; the SQLite backend has a real index
+        terms = search_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            chats = self.db.all()
+        results = []
+        for chat in sorted(chats, key=lambda chat: chat["timestamp"], reverse=True):
+            for seq, message in enumerate(chat.get("messages", [])):
+                content = message["content"].lower()
+                if all(term in content for term in terms):
+                    results.append({
+                        "chat_id": chat["chat_id"],
+                        "seq": seq,
+                        "role": message["role"],
+                        "timestamp": message.get("timestamp"),
+                        "snippet": make_snippet(message["content"], terms),
+                    })
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def clear(self):
+        with self._lock:
+            self.db.truncate()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+class SQLiteStorage(ChatStorage):
+    """SQLite store: one row per message, indexed by chat_id, in WAL mode.
+
+    append_messages only inserts the new rows of a chat, and the number of
+    chats is kept in a trigger-maintained counter so counting doesn't scan
+    the table. Appends grow the write-ahead log, so every
+    COMPACT_EVERY appends the log is checkpointed back into the database.
+
+    Message text is indexed in an FTS5 table kept in sync by triggers, so
+    every save updates the search index with just the rows it wrote. On
+    SQLite builds without FTS5, search falls back to scanning messages.
+    """
+
+    COMPACT_EVERY = 200
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            chat_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, seq);
+        CREATE INDEX IF NOT EXISTS idx_chats_timestamp ON chats (timestamp, chat_id);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO counters (name, value)
+            VALUES ('chats', (SELECT COUNT(*) FROM chats));
+        CREATE TRIGGER IF NOT EXISTS chats_count_insert AFTER INSERT ON chats BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'chats';
+        END;
+        CREATE TRIGGER IF NOT EXISTS chats_count_delete AFTER DELETE ON chats BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'chats';
+        END;
+    """
+
+    # External-content index: the text lives only in messages, FTS5 keeps the inverted index
+    SEARCH_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END;
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END;
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, pool_size=4):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        # SQLite allows one writer at a time; queueing writers here avoids busy-retry churn,
+        # while WAL lets readers on the other pooled connections proceed in parallel
+        self._write_lock = threading.Lock()
+        self._appends_since_compact = 0
+        with self._write() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self.full_text_search = self._create_search_index(conn)
+
+    def _create_search_index(self, conn):
+        """Set up the FTS5 index; returns False if this SQLite lacks FTS5"""
+        existed = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+        try:
+            conn.executescript(self.SEARCH_SCHEMA)
+        except sqlite3.OperationalError:
+            return False
+        if not existed:
+            # Index the messages saved before the search index existed
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        return True
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """Borrow a pooled connection, opening a new one while under pool_size"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextlib.contextmanager
+    def _write(self):
+        """A pooled connection inside a transaction, holding the write lock"""
+        with self._write_lock, self._connection() as conn, conn:
+            yield conn
+
+    def import_tinydb(self, path=DEFAULT_TINYDB_PATH):
+        """Copy the chats of a TinyDB file (the store before SQLite) that aren't stored here yet.
+
+        Runs in one transaction and is recorded in counters, so it happens once
+        per database; a chat already here (e.g. continued after switching) is
+        kept as is. Returns the number of chats imported.
+        """
+        with self._connection() as conn:
+            if conn.execute("SELECT 1 FROM counters WHERE name = 'tinydb_import'").fetchone():
+                return 0
+        try:
+            source = TinyDBStorage(path)
+        except ImportError:
+            logger.warning("%s was not imported: tinydb is not installed", path)
+            return 0
+        imported = 0
+        try:
+            with self._write() as conn:
+                for chat in source.db.all():
+                    chat_id = chat["chat_id"]
+                    if conn.execute("SELECT 1 FROM chats WHERE chat_id = ?", (chat_id,)).fetchone():
+                        continue
+                    messages = chat.get("messages", [])
+                    self._insert_messages(conn, chat_id, messages, 0)
+                    self._upsert_chat(conn, chat_id, chat["timestamp"], len(messages))
+                    imported += 1
+                conn.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('tinydb_import', ?)", (imported,))
+        finally:
+            source.close()
+        if imported:
+            logger.info("Imported %d chats from %s", imported, path)
+        return imported
+
+    def save_chat(self, chat_id, messages, timestamp):
+        # A full save replaces the chat's rows; append_messages is the cheap path
+        with self._write() as conn:
+            conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._insert_messages(conn, chat_id, messages, 0)
+            self._upsert_chat(conn, chat_id, timestamp, len(messages))
+
+    def append_messages(self, chat_id, messages, start_seq, timestamp):
+        with self._write() as conn:
+            # Checked in the same transaction as the insert, so a clear or a
+            # retried append in between can't leave a gap or duplicate rows
+            row = conn.execute("SELECT message_count FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+            if (row[0] if row else 0) != start_seq:
+                return False
+            self._insert_messages(conn, chat_id, messages, start_seq)
+            self._upsert_chat(conn, chat_id, timestamp, start_seq + len(messages))
+            self._appends_since_compact += 1
+            compact_due = self._appends_since_compact >= self.COMPACT_EVERY
+        if compact_due:
+            self.compact()
+        return True
+
+    def _insert_messages(self, conn, chat_id, messages, start_seq):
+        conn.executemany(
+            "INSERT INTO messages (chat_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+            [
+                (chat_id, seq, msg["role"], msg["content"], msg.get("timestamp"))
+                for seq, msg in enumerate(messages, start=start_seq)
+            ]
+        )
+
+    def _upsert_chat(self, conn, chat_id, timestamp, message_count):
+        conn.execute(
+            "INSERT INTO chats (chat_id, timestamp, message_count) VALUES (?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET timestamp = excluded.timestamp, "
+            "message_count = excluded.message_count",
+            (chat_id, timestamp, message_count)
+        )
+
+    def compact(self):
+        with self._write_lock, self._connection() as conn:
+            self._appends_since_compact = 0
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA optimize")
+
+    def load_chat(self, chat_id):
+        with self._connection() as conn:
+            chat = conn.execute(
+                "SELECT chat_id, timestamp FROM chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            if chat is None:
+                return None
+            rows = conn.execute(
+                "SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY seq",
+                (chat_id,)
+            ).fetchall()
+        return {
+            "chat_id": chat["chat_id"],
+            "messages": [dict(row) for row in rows],
+            "timestamp": chat["timestamp"]
+        }
+
+    def iter_messages(self, chat_id, batch_size=500):
+        # Read through a cursor, so a long chat never sits in memory whole
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "SELECT role, content, timestamp FROM messages WHERE chat_id = ? ORDER BY seq",
+                (chat_id,)
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+
+    def count_chats(self):
+        with self._connection() as conn:
+            row = conn.execute("SELECT value FROM counters WHERE name = 'chats'").fetchone()
+        return row["value"] if row else 0
+
+    def list_chats(self, before=None, limit=20):
+        # Keyset pagination over idx_chats_timestamp, so later pages cost the same as the first
+        query = (
+            "SELECT chat_id, timestamp, message_count, COALESCE(("
+            "SELECT substr(content, 1, ?) FROM messages m WHERE m.chat_id = c.chat_id AND m.seq = 0"
+            "), '') AS title FROM chats c"
+        )
+        params = [TITLE_CHARS]
+        if before is not None:
+            query += " WHERE (timestamp, chat_id) < (?, ?)"
+            params.extend(before)
+        query += " ORDER BY timestamp DESC, chat_id DESC LIMIT ?"
+        params.append(limit)
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_messages(self, query, limit=20):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        if not self.full_text_search:
+            return self._scan_messages(terms, limit)
+        # Quoted terms so user input can't be read as FTS5 syntax; the last is a
+        # prefix so results show up while a word is still being typed
+        match = " ".join(f'"{term}"' for term in terms) + "*"
+        # Newest first: FTS5 walks its rowid-ordered doclists and stops at limit,
+        # where ORDER BY rank would score every match (~250 ms for a common word in 100k messages)
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT m.chat_id, m.seq, m.role, m.timestamp, "
+                "snippet(messages_fts, 0, '**', '**', '…', ?) AS snippet "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "WHERE messages_fts MATCH ? ORDER BY messages_fts.rowid DESC LIMIT ?",
+                (SNIPPET_TOKENS, match, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _scan_messages(self, terms, limit):
+        conditions = " AND ".join("content LIKE ? ESCAPE '\\'" for _ in terms)
+        patterns = ["%" + term.replace("_", "\\_") + "%" for term in terms]
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT chat_id, seq, role, timestamp, content FROM messages "
+                f"WHERE {conditions} ORDER BY id DESC LIMIT ?",
+                (*patterns, limit)
+            ).fetchall()
+        return [
+            {
+                "chat_id": row["chat_id"],
+                "seq": row["seq"],
+                "role": row["role"],
+                "timestamp": row["timestamp"],
+                "snippet": make_snippet(row["content"], terms),
+            }
+            for row in rows
+        ]
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM chats")
+
+    def close(self):
+        with self._pool_lock:
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+STORAGE_BACKENDS = {
+    "sqlite": SQLiteStorage,
+    "tinydb": TinyDBStorage,
+}
+
+
+def open_storage(backend="sqlite", path=None):
+    """Open a chat storage backend by name ("sqlite" or "tinydb").
+
+    The default SQLite database picks up the chats of an existing default
+    chat_history.json on first open, so switching backends loses no history.
+    """
+    try:
+        storage_class = STORAGE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {sorted(STORAGE_BACKENDS)}")
+    chat_storage = storage_class(path) if path else storage_class()
+    if backend == "sqlite" and not path and os.path.exists(DEFAULT_TINYDB_PATH):
+        chat_storage.import_tinydb(DEFAULT_TINYDB_PATH)
+    return chat_storage
@@ -0,0 +1,159 @@
+import json
+import statistics
+from io import BytesIO
+
+import pytest
+
+import data_profiler
+from data_profiler import JsonStream
+
+# Small enough that tokens, multi-byte characters and numbers straddle chunk boundaries
+CHUNK_SIZES = [1, 2, 3, 7, 64]
+
+ARRAY = json.dumps([
+    {"id": 1, "name": "café", "tags": ["a", "b"], "score": 12345.678},
+    {"id": 2, "name": "naïve 🚀", "nested": {"deep": [1, [2, [3]]], "empty": {}}, "score": -1e-3},
+    [], {}, "string with \"escapes\" and \\ backslashes", 1234567890, 0.5, True, False, None,
+], ensure_ascii=False)
+
+OBJECT = json.dumps({
+    "title": "report",
+    "rows": [{"x": 1, "y": [1, 2]}, {"x": 2, "y": []}],
+    "empty": [],
+    "meta": {"pages": [1, 2, 3], "author": "ünïcode"},
+    "matrix": [[1, 2], [3, 4]],
+    "count": 100000,
+}, ensure_ascii=False, indent=2)
+
+JSON_LINES = "\n".join(json.dumps(record, ensure_ascii=False) for record in [
+    {"event": "start", "at": 1700000000},
+    {"event": "naïve", "values": [1.5, 2.5], "user": {"id": 7}},
+    [1, 2, 3],
+    "plain string",
+    42,
+]) + "\n"
+
+
+def read_object(stream):
+    """A top-level object read member by member, as profile_json_object does"""
+    result = {}
+    for key in stream.object_keys():
+        result[key] = list(stream.array_items()) if stream.peek() == '[' else stream.value()
+    return result
+
+
+@pytest.mark.parametrize("chunk_chars", CHUNK_SIZES)
+def test_array_items_match_json_loads(chunk_chars):
+    stream = JsonStream(ARRAY.encode("utf-8"), chunk_chars=chunk_chars)
+    assert list(stream.array_items()) == json.loads(ARRAY)
+    assert stream.peek() == ''
+
+
+@pytest.mark.parametrize("chunk_chars", CHUNK_SIZES)
+def test_object_with_nested_arrays_matches_json_loads(chunk_chars):
+    stream = JsonStream(OBJECT.encode("utf-8"), chunk_chars=chunk_chars)
+    assert read_object(stream) == json.loads(OBJECT)
+
+
+@pytest.mark.parametrize("chunk_chars", CHUNK_SIZES)
+def test_json_lines_match_json_loads(chunk_chars):
+    stream = JsonStream(JSON_LINES.encode("utf-8"), chunk_chars=chunk_chars)
+    assert list(stream.values()) == [json.loads(line) for line in JSON_LINES.splitlines()]
+
+
+@pytest.mark.parametrize("chunk_chars", CHUNK_SIZES)
+@pytest.mark.parametrize("text", ["42", "-1.25e10", "123456789012345678901234567890", '"naïve 🚀"',
+                                  "true", "false", "null", "  7  "])
+def test_scalars_match_json_loads(text, chunk_chars):
+    assert JsonStream(text.encode("utf-8"), chunk_chars=chunk_chars).value() == json.loads(text)
+
+
+def test_byte_order_mark_is_skipped():
+    data = "\ufeff[1, 2]".encode("utf-8")
+    assert list(JsonStream(data, chunk_chars=1).array_items()) == [1, 2]
+
+
+def test_malformed_json_raises():
+    with pytest.raises(ValueError):
+        list(JsonStream(b'[1, 2 3]', chunk_chars=2).array_items())
+    with pytest.raises(ValueError):
+        JsonStream(b'{"a": ', chunk_chars=2).value()
+
+
+def test_profile_json_array():
+    summary = data_profiler.profile_json(json.dumps([{"a": i, "b": f"v{i % 2}"} for i in range(20)]).encode())
+    assert summary.startswith("JSON array: 20 rows x 2 columns")
+    assert "- a (integer): 20 distinct; min 0, max 19, mean 9.5" in summary
+    assert '- b (text): 2 distinct; length 2-2; top: "v0" (10), "v1" (10)' in summary
+
+
+def test_profile_json_lines():
+    summary = data_profiler.profile_json(JSON_LINES.encode("utf-8"))
+    assert summary.startswith("JSON Lines: 5 rows x")
+
+
+def test_profile_json_object_profiles_its_arrays():
+    summary = data_profiler.profile_json(OBJECT.encode("utf-8"))
+    assert summary.startswith("JSON object with 6 keys:")
+    assert "- rows: array of 2 items" in summary
+    assert '- title: string "report"' in summary
+    assert 'JSON array "rows": 2 rows x 2 columns' in summary
+
+
+def test_profile_json_scalar():
+    assert data_profiler.profile_json(b" 42 ") == "JSON value: 42"
+
+
+def make_csv(rows):
+    lines = ["id,name,score"]
+    for i in range(1, rows + 1):
+        score = "" if i % 5 == 0 else str(i * 1.5)
+        lines.append(f"{i},{'ab'[i % 2]},{score}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def test_csv_profile_matches_whole_file_statistics():
+    data = make_csv(23)
+    summary = data_profiler.profile_csv(data, chunk_rows=4)
+    scores = [i * 1.5 for i in range(1, 24) if i % 5]
+    assert summary.startswith("CSV file: 23 rows x 3 columns")
+    assert (f"- score (float): 4 null; 19 distinct; min 1.5, max 34.5, "
+            f"mean {data_profiler.format_number(statistics.mean(scores))}, "
+            f"std {data_profiler.format_number(statistics.stdev(scores))}") in summary
+    assert '- name (text): 2 distinct; length 1-1; top: "b" (12), "a" (11)' in summary
+    assert "Random sample of 10 rows:" in summary
+
+
+def test_csv_profile_does_not_depend_on_chunk_size():
+    data = make_csv(50)
+    assert data_profiler.profile_csv(data, chunk_rows=3) == data_profiler.profile_csv(data)
+
+
+def test_small_csv_lists_every_row():
+    summary = data_profiler.profile_csv(make_csv(3))
+    assert "All 3 rows:" in summary
+
+
+def test_xlsx_profile_covers_every_sheet():
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Sales"
+    sheet.append(["region", "amount", "amount"])
+    for i in range(1, 8):
+        sheet.append(["north" if i % 2 else "south", i * 10, i])
+    # A short row and a blank row: padded and skipped
+    sheet.append(["west"])
+    sheet.append([None, None, None])
+    workbook.create_sheet("Empty")
+    buffer = BytesIO()
+    workbook.save(buffer)
+
+    summary = data_profiler.profile_xlsx(buffer.getvalue(), chunk_rows=2)
+    assert 'Sheet "Sales": 8 rows x 3 columns' in summary
+    # The padded cell makes pandas read the column as float, as a blank CSV cell does
+    assert "- amount (float): 1 null; 7 distinct; min 10, max 70, mean 40" in summary
+    assert "- amount.1 (float): 1 null; 7 distinct; min 1, max 7, mean 4" in summary
+    assert '- region (text): 3 distinct; length 4-5; top: "north" (4), "south" (3), "west" (1)' in summary
+    assert 'Sheet "Empty": empty' in summary
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import pytest
+
+import fake_gemini
+from request_engine import RequestEngine, is_retryable
+
+
+class BadRequestModel:
+    """A model whose every call fails the way an invalid request does"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False):
+        self.calls += 1
+        raise ValueError("400 invalid argument")
+
+
+@pytest.fixture
+def engine():
+    engine = RequestEngine(requests_per_minute=600000, burst=100, base_delay=0.001, max_delay=0.01)
+    yield engine
+    engine.close()
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (fake_gemini.FakeRateLimitError("429"), True),
+    (fake_gemini.FakeNotFoundError("404"), False),
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (ValueError("400 invalid argument"), False),
+    (type("ServiceUnavailable", (Exception,), {})(), True),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_retries_until_the_call_succeeds(engine):
+    model = fake_gemini.FakeGenerativeModel(latency=0, fail_first=2)
+    response = engine.generate(model, ["hello"])
+    assert "You asked: hello" in response.text
+    assert model.calls == 3
+    assert engine.stats["retries"] == 2
+    assert engine.stats["failures"] == 0
+
+
+def test_gives_up_once_retries_run_out():
+    engine = RequestEngine(requests_per_minute=600000, max_retries=2, base_delay=0.001, max_delay=0.01)
+    model = fake_gemini.FakeGenerativeModel(latency=0, fail_first=10)
+    try:
+        with pytest.raises(fake_gemini.FakeRateLimitError):
+            engine.generate(model, ["hello"])
+    finally:
+        engine.close()
+    assert model.calls == 3
+    assert engine.stats["failures"] == 1
+
+
+def test_non_retryable_errors_are_raised_at_once(engine):
+    model = BadRequestModel()
+    with pytest.raises(ValueError):
+        engine.generate(model, ["hello"])
+    assert model.calls == 1
+    assert engine.stats["retries"] == 0
+    assert engine.stats["failures"] == 1
+
+
+def test_identical_requests_in_flight_share_one_call(engine):
+    model = fake_gemini.FakeGenerativeModel(latency=0.2)
+
+    async def ask_concurrently():
+        return await asyncio.gather(*[
+            engine.agenerate(model, ["same question"], coalesce_key="same-key") for _ in range(5)
+        ])
+
+    responses = engine.run(ask_concurrently())
+    assert model.calls == 1
+    assert engine.stats["coalesced"] == 4
+    assert len({response.text for response in responses}) == 1
+
+
+def test_streams_are_never_coalesced(engine):
+    model = fake_gemini.FakeGenerativeModel(latency=0.05)
+
+    async def stream_concurrently():
+        return await asyncio.gather(*[
+            engine.agenerate(model, ["same question"], stream=True, coalesce_key="same-key") for _ in range(3)
+        ])
+
+    engine.run(stream_concurrently())
+    assert model.calls == 3
+    assert engine.stats["coalesced"] == 0
+
+
+def test_requests_beyond_the_burst_wait_for_the_rate():
+    # 20 requests per second after a burst of 2: the 4 calls past the burst need ~0.2s
+    engine = RequestEngine(requests_per_minute=1200, burst=2)
+    model = fake_gemini.FakeGenerativeModel(latency=0)
+    try:
+        start = time.monotonic()
+        for _ in range(6):
+            engine.generate(model, ["hello"], api_key="key")
+        elapsed = time.monotonic() - start
+    finally:
+        engine.close()
+    assert elapsed >= 0.15
+    assert engine.stats["throttled_seconds"] >= 0.15
+
+
+def test_each_api_key_has_its_own_bucket():
+    engine = RequestEngine(requests_per_minute=60, burst=1)
+    model = fake_gemini.FakeGenerativeModel(latency=0)
+    try:
+        start = time.monotonic()
+        for api_key in ("first", "second", "third"):
+            engine.generate(model, ["hello"], api_key=api_key)
+        elapsed = time.monotonic() - start
+    finally:
+        engine.close()
+    assert elapsed < 0.5
+    assert engine.stats["throttled_seconds"] == 0
+
+
+def test_token_counts_do_not_spend_the_generate_budget():
+    engine = RequestEngine(requests_per_minute=60, burst=1)
+    model = fake_gemini.FakeGenerativeModel(latency=0)
+    try:
+        assert engine.count_tokens(model, "x" * 400) == 100
+        engine.generate(model, ["hello"])
+    finally:
+        engine.close()
+    assert engine.stats["token_counts"] == 1
+    assert engine.stats["throttled_seconds"] == 0
+
+
+def test_backoff_stays_within_its_step():
+    engine = RequestEngine(base_delay=1.0, max_delay=8.0)
+    try:
+        for attempt, step in [(0, 1.0), (2, 4.0), (5, 8.0)]:
+            delay = engine.backoff_delay(attempt)
+            assert step / 2 <= delay <= step
+    finally:
+        engine.close()
+
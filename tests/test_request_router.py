@@ -0,0 +1,49 @@
+import pytest
+
+import request_router
+from request_router import MODE_FILE_ANALYSIS, MODE_IMAGE, MODE_TEXT, RequestRouter
+
+
+@pytest.mark.parametrize("prompt", [
+    "[Professional style] draw a cat",
+    "Create an image of a sunset",
+    "Can you design a logo for my cafe",
+    "Generate a beautiful picture of mountains",
+    "generate me a cute picture of a dog",
+    "Make images of a rainy street",
+    "please sketch some trees",
+    "Create 3 posters for the launch",
+])
+def test_image_requests(prompt):
+    assert RequestRouter().route(prompt).mode == MODE_IMAGE
+
+
+@pytest.mark.parametrize("prompt", [
+    "How do I render images in React?",
+    "How can I make my photos load faster?",
+    "Imagine you are a recruiter reviewing my resume",
+    "Illustrate the difference between TCP and UDP",
+    "Explain how to produce graphics with matplotlib",
+    "What design pattern fits here?",
+    "Is there a drawback to this approach?",
+    "Draw conclusions from the survey results",
+])
+def test_questions_stay_text(prompt):
+    assert RequestRouter().route(prompt).mode == MODE_TEXT
+
+
+def test_files_route_to_analysis_unless_a_picture_is_asked_for():
+    router = RequestRouter()
+    assert router.route("Summarize this report", files=["text"]).mode == MODE_FILE_ANALYSIS
+    assert router.route("Create an image of this chart", files=["text"]).mode == MODE_IMAGE
+    assert router.stats() == {MODE_FILE_ANALYSIS: 1, MODE_IMAGE: 1}
+
+
+def test_explicit_modes():
+    router = RequestRouter()
+    assert router.route("Draw a cat", mode=request_router.MODE_TEXT).mode == MODE_TEXT
+    assert router.route("hello", mode=MODE_IMAGE).mode == MODE_IMAGE
+    assert router.route("hello", mode=MODE_IMAGE, image_available=False).mode == MODE_TEXT
+    assert router.route("hello", mode=MODE_FILE_ANALYSIS).mode == MODE_TEXT
+    with pytest.raises(ValueError):
+        router.route("hello", mode="video")
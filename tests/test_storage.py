@@ -0,0 +1,86 @@
+import pytest
+
+import storage
+
+
+def messages(count, start=0):
+    return [
+        {"role": "user" if seq % 2 == 0 else "assistant", "content": f"message {seq}",
+         "timestamp": f"2024-01-01T00:00:{seq:02d}"}
+        for seq in range(start, start + count)
+    ]
+
+
+@pytest.fixture(params=sorted(storage.STORAGE_BACKENDS))
+def chat_storage(request, tmp_path):
+    suffix = "db" if request.param == "sqlite" else "json"
+    chat_storage = storage.open_storage(request.param, str(tmp_path / f"chat_history.{suffix}"))
+    yield chat_storage
+    chat_storage.close()
+
+
+def test_append_continues_a_saved_chat(chat_storage):
+    chat_storage.save_chat("chat", messages(4), "2024-01-01T00:01:00")
+    assert chat_storage.append_messages("chat", messages(2, start=4), 4, "2024-01-01T00:02:00")
+    chat = chat_storage.load_chat("chat")
+    assert [msg["content"] for msg in chat["messages"]] == [f"message {seq}" for seq in range(6)]
+    assert chat_storage.list_chats()[0]["message_count"] == 6
+
+
+def test_append_after_clear_is_refused(chat_storage):
+    chat_storage.save_chat("chat", messages(4), "2024-01-01T00:01:00")
+    chat_storage.clear()
+    assert not chat_storage.append_messages("chat", messages(2, start=4), 4, "2024-01-01T00:02:00")
+    assert chat_storage.load_chat("chat") is None
+
+
+def test_clear_then_save_keeps_every_message(chat_storage):
+    # What save_chat_to_db does: append since the last save, or save the whole chat when refused
+    history = messages(4)
+    chat_storage.save_chat("chat", history, "2024-01-01T00:01:00")
+    chat_storage.clear()
+    history += messages(2, start=4)
+    if not chat_storage.append_messages("chat", history[4:], 4, "2024-01-01T00:02:00"):
+        chat_storage.save_chat("chat", history, "2024-01-01T00:02:00")
+    chat = chat_storage.load_chat("chat")
+    assert [msg["content"] for msg in chat["messages"]] == [msg["content"] for msg in history]
+    assert chat_storage.list_chats()[0]["message_count"] == 6
+
+
+def test_retried_append_is_refused(chat_storage):
+    chat_storage.save_chat("chat", messages(2), "2024-01-01T00:01:00")
+    assert chat_storage.append_messages("chat", messages(2, start=2), 2, "2024-01-01T00:02:00")
+    assert not chat_storage.append_messages("chat", messages(2, start=2), 2, "2024-01-01T00:02:00")
+    assert len(chat_storage.load_chat("chat")["messages"]) == 4
+
+
+def test_sqlite_imports_the_tinydb_history_once(tmp_path):
+    json_path = str(tmp_path / "chat_history.json")
+    old = storage.open_storage("tinydb", json_path)
+    old.save_chat("old", messages(3), "2024-01-01T00:01:00")
+    old.save_chat("both", messages(2), "2024-01-01T00:02:00")
+    old.close()
+
+    chat_storage = storage.open_storage("sqlite", str(tmp_path / "chat_history.db"))
+    chat_storage.save_chat("both", messages(4), "2024-01-02T00:00:00")
+    assert chat_storage.import_tinydb(json_path) == 1
+    assert chat_storage.count_chats() == 2
+    assert len(chat_storage.load_chat("old")["messages"]) == 3
+    # A chat continued after the switch keeps its newer messages
+    assert len(chat_storage.load_chat("both")["messages"]) == 4
+    assert chat_storage.search_messages("message 2")[0]["chat_id"] in ("old", "both")
+
+    chat_storage.clear()
+    assert chat_storage.import_tinydb(json_path) == 0
+    chat_storage.close()
+
+
+def test_default_sqlite_store_migrates_chat_history_json(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    old = storage.open_storage("tinydb")
+    old.save_chat("old", messages(2), "2024-01-01T00:01:00")
+    old.close()
+
+    chat_storage = storage.open_storage()
+    assert [summary["chat_id"] for summary in chat_storage.list_chats()] == ["old"]
+    chat_storage.close()
@@ -0,0 +1,155 @@
+"""Text-to-speech for app.py, synthesized off the request path.
+
+AudioSynthesizer runs an engine on a small thread pool and caches the audio
+by (normalized text, language), so the chat can show a response before its
+audio exists and replaying identical text costs nothing.
+"""
+import concurrent.futures
+import io
+import logging
+import math
+import re
+import struct
+import threading
+import time
+import wave
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# gTTS gets slow and flaky on long inputs; the app only ever reads out the start
+MAX_TTS_CHARS = 1000
+
+
+def normalize_tts_text(text):
+    """Collapse whitespace and trim to what the engine will actually read"""
+    return re.sub(r'\s+', ' ', text or '').strip()[:MAX_TTS_CHARS]
+
+
+class GTTSEngine:
+    """Google Translate TTS; returns MP3 bytes written to an in-memory buffer"""
+
+    mime_type = "audio/mpeg"
+
+    def synthesize(self, text, lang):
+        # Imported on first use: most sessions never get as far as speech
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class LocalToneEngine:
+    """Offline stand-in engine: a short WAV tone whose length tracks the text.
+
+    Useful for testing and for deployments without network access to gTTS.
+    """
+
+    mime_type = "audio/wav"
+
+    def __init__(self, sample_rate=8000, seconds_per_char=0.02):
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text, lang):
+        frames = int(self.sample_rate * max(0.2, len(text) * self.seconds_per_char))
+        samples = b''.join(
+            struct.pack('<h', int(3000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)))
+            for i in range(frames)
+        )
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(samples)
+        return buffer.getvalue()
+
+
+TTS_ENGINES = {
+    "gtts": GTTSEngine,
+    "local": LocalToneEngine,
+}
+
+
+class AudioSynthesizer:
+    """Background TTS with an LRU cache and de-duplication of in-flight requests.
+
+    Each synthesis is recorded as the "tts" stage of metrics, if given.
+    """
+
+    def __init__(self, engine=None, max_workers=2, cache_size=256, metrics=None):
+        self.engine = engine or GTTSEngine()
+        self.cache_size = cache_size
+        self.metrics = metrics
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tts"
+        )
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, lang):
+        return (normalize_tts_text(text), lang)
+
+    def submit(self, text, lang='en'):
+        """Start synthesizing text in the background and return its cache key.
+
+        Returns None when there is nothing to read out.
+        """
+        key = self.make_key(text, lang)
+        if not key[0]:
+            return None
+        with self._lock:
+            if key in self._cache or key in self._in_flight:
+                return key
+            self._in_flight[key] = self._executor.submit(self._synthesize, key)
+        return key
+
+    def _synthesize(self, key):
+        text, lang = key
+        start = time.perf_counter()
+        try:
+            audio_bytes = self.engine.synthesize(text, lang)
+        except Exception:
+            logger.exception("Audio generation failed")
+            audio_bytes = None
+        if self.metrics is not None:
+            self.metrics.observe("tts", time.perf_counter() - start,
+                                 size=len(audio_bytes) if audio_bytes else None, error=audio_bytes is None)
+        with self._lock:
+            self._in_flight.pop(key, None)
+            # Failures aren't cached so a later request can retry
+            if audio_bytes:
+                self._cache[key] = audio_bytes
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return audio_bytes
+
+    def poll(self, key):
+        """Return (done, audio_bytes) without blocking; audio_bytes is None if synthesis failed"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return True, self._cache[key]
+            future = self._in_flight.get(key)
+        if future is None:
+            # Neither cached nor running: it failed, or was evicted before anyone looked
+            return True, None
+        if not future.done():
+            return False, None
+        return True, future.result()
+
+    def synthesize(self, text, lang='en', timeout=None):
+        """Blocking variant of submit() + poll()"""
+        key = self.submit(text, lang)
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            future = self._in_flight.get(key)
+        return future.result(timeout=timeout) if future else self.poll(key)[1]